@@ -0,0 +1,131 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from fastapi import APIRouter, Request, status
+from fastapi.responses import Response, StreamingResponse
+
+from app.services import db, workers
+from app.services.charts import series_payload
+from app.services.live import Broadcaster
+from app.services.metrics import Counter, Gauge
+from app.services.rollups import ALIGN, RollupStore
+from app.services.series_cache import RollupBackfill, SeriesCache
+
+TURBIDITY_TABLE = "turbidity_data"
+TURBIDITY_COLUMNS = "id,sensor_id,timestamp,raw_value,voltage"
+TURBIDITY_DTYPES = {"id": "int64", "sensor_id": "category", "timestamp": str, "raw_value": "float32", "voltage": "float32"}
+
+
+FETCHES = Counter("homesense_turbidity_fetches_total", "Turbidity fetches: open-ended, bounded or new rows", ["range"])
+
+
+async def fetch_turbidity(since, until=None, max_id=None, after_id=None):
+    """Turbidity rows with since <= timestamp < until, ordered by timestamp.
+
+    ``max_id`` leaves out rows inserted after that id. With ``after_id`` the
+    rows inserted after that id are returned instead, ordered by id.
+    """
+    filters = [("timestamp", f"gte.{since.isoformat()}")]
+    if until is not None:
+        filters.append(("timestamp", f"lt.{until.isoformat()}"))
+    if max_id is not None:
+        filters.append(("id", f"lte.{max_id}"))
+    if after_id is not None:
+        FETCHES.inc(range="new")
+        filters.append(("id", f"gt.{after_id}"))
+        return await db.select_keyset(TURBIDITY_TABLE, TURBIDITY_COLUMNS, filters, key=("id",), dtype=TURBIDITY_DTYPES)
+    FETCHES.inc(range="open" if until is None else "bounded")
+    return await db.select_keyset(TURBIDITY_TABLE, TURBIDITY_COLUMNS, filters, dtype=TURBIDITY_DTYPES)
+
+
+async def latest_turbidity_id():
+    """Id of the most recently inserted turbidity row, 0 for an empty table."""
+    df = await db.select_csv(TURBIDITY_TABLE, "id", order="id.desc", limit=1)
+    return int(df["id"].iloc[0]) if len(df) else 0
+
+
+rollups = RollupStore()
+series_cache = SeriesCache(fetch_turbidity, latest_turbidity_id, on_rows=rollups.ingest, align=ALIGN)
+backfill = RollupBackfill(fetch_turbidity, rollups, align=ALIGN)
+live = Broadcaster(series_cache)
+# Ranges beyond the raw cache window are served from the 15min/1h tiers
+MAX_DAYS = 90
+HEARTBEAT_SEC = 15
+
+CACHE_COUNTERS = ("hits", "misses", "shared", "refills", "refill_errors", "rows_fetched", "rows_evicted")
+CACHE_GAUGES = ("sensors", "rows_cached", "bytes_cached", "last_refill_ms")
+
+Counter("homesense_series_cache_total", "Series cache events", ["event"],
+        callback=lambda: {(k,): series_cache.stats[k] for k in CACHE_COUNTERS})
+Gauge("homesense_series_cache", "Series cache size and last refill time", ["field"],
+      callback=lambda: {(k,): v for k, v in series_cache.snapshot().items() if k in CACHE_GAUGES})
+Counter("homesense_rollup_backfill_total", "Rollup backfills from the database", ["event"],
+        callback=lambda: {(k,): backfill.stats[k] for k in ("fills", "fill_errors", "rows_fetched")})
+Gauge("homesense_live_subscribers", "Connected live dashboards", callback=lambda: {(): live.subscribers})
+
+# Payloads by ETag, so viewers asking for the same thing within a minute
+# share one computation
+_payloads = {}
+MAX_PAYLOADS = 8
+
+router = APIRouter(prefix="/api")
+
+
+@router.get("/series")
+async def series(request: Request, days: int = 7):
+    if not request.session.get("user"):
+        return Response(status_code=status.HTTP_401_UNAUTHORIZED)
+
+    days = max(1, min(days, MAX_DAYS))
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+    await series_cache.refresh(start)
+    raw_start = max(start, end - series_cache.window)
+    if raw_start > start:
+        await backfill.fill(start, raw_start)
+
+    # Same data version and same minute means the browser's copy is current
+    etag = f'W/"{series_cache.version}.{backfill.version}-{days}-{int(end.timestamp()) // 60}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    task = _payloads.get(etag)
+    if task is None:
+        frames = series_cache.window_frames(start)
+        task = asyncio.ensure_future(workers.run_cpu(series_payload, rollups, frames, start, end, days, raw_start))
+        _payloads[etag] = task
+        while len(_payloads) > MAX_PAYLOADS:
+            _payloads.pop(next(iter(_payloads)))
+    try:
+        payload = await asyncio.shield(task)
+    except Exception:
+        _payloads.pop(etag, None)
+        raise
+    return Response(payload, media_type="application/json", headers=headers)
+
+
+@router.get("/stream")
+async def stream(request: Request):
+    """Server-sent events with rows ingested since the page loaded."""
+    if not request.session.get("user"):
+        return Response(status_code=status.HTTP_401_UNAUTHORIZED)
+
+    subscriber = live.subscribe()
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event, data = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event}\ndata: {data}\n\n"
+        finally:
+            live.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
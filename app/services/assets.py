@@ -0,0 +1,37 @@
+import os
+
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+from starlette.staticfiles import StaticFiles
+
+STATIC_DIR = "app/static"
+IMMUTABLE_DIR = "js"
+PLOTLY_JS = f"{IMMUTABLE_DIR}/plotly-{get_plotlyjs_version()}.min.js"
+
+
+def ensure_plotly_js():
+    """Write the plotly.js bundle shipped with the Python package into app/static once.
+
+    The file name carries the plotly.js version, so browsers can cache it
+    forever and an upgrade simply changes the URL.
+    """
+    path = os.path.join(STATIC_DIR, PLOTLY_JS)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(get_plotlyjs())
+        os.replace(tmp, path)
+    return f"/static/{PLOTLY_JS}"
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with a year-long immutable Cache-Control on versioned assets."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        relative = os.path.relpath(full_path, os.path.realpath(self.directory))
+        if relative.startswith(IMMUTABLE_DIR + os.sep):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers.setdefault("Cache-Control", "public, max-age=3600")
+        return response
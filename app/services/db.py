@@ -0,0 +1,123 @@
+import io
+import os
+
+import httpx
+import pandas as pd
+from dotenv import load_dotenv
+
+from app.services.metrics import ROWS_BUCKETS, Counter, Histogram, timer
+from app.services.workers import run_cpu
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+
+# Supabase caps every PostgREST response at 1000 rows by default
+PAGE_SIZE = int(os.getenv("POSTGREST_PAGE_SIZE", "1000"))
+MAX_CONNECTIONS = int(os.getenv("POSTGREST_MAX_CONNECTIONS", "20"))
+TIMEOUT_SEC = float(os.getenv("POSTGREST_TIMEOUT_SEC", "15"))
+
+_client = None
+
+QUERY_SECONDS = Histogram("homesense_db_query_seconds", "PostgREST round-trip latency", ["table"])
+QUERY_ROWS = Histogram("homesense_db_query_rows", "Rows returned per PostgREST request", ["table"], ROWS_BUCKETS)
+ROWS_FETCHED = Counter("homesense_db_rows_fetched_total", "Rows fetched from PostgREST", ["table"])
+BYTES_FETCHED = Counter("homesense_db_bytes_fetched_total", "Response bytes fetched from PostgREST", ["table"])
+
+
+def get_client():
+    """Shared, connection-pooled async client for the PostgREST API."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=f"{SUPABASE_URL}/rest/v1",
+            headers={"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}"},
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            timeout=TIMEOUT_SEC,
+        )
+    return _client
+
+
+def set_client(client):
+    """Use a preconfigured client, e.g. one with a mock transport for benchmarks."""
+    global _client
+    _client = client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def select_csv(table, columns, filters=(), order=None, limit=None, dtype=None):
+    """One GET against a table, e.g. filters=[("device_id", "eq.RP1")].
+
+    Asks PostgREST for CSV and parses it with pandas' C reader. Parsing runs on the worker pool, so large pages don't stall the event loop.
+    """
+    params = [("select", columns), *filters]
+    if order:
+        params.append(("order", order))
+    if limit:
+        params.append(("limit", str(limit)))
+    with timer("query"), QUERY_SECONDS.time(table=table):
+        response = await get_client().get(f"/{table}", params=params, headers={"Accept": "text/csv"})
+        response.raise_for_status()
+    rows = await run_cpu(_parse_csv, response.content, columns, dtype)
+    _count(table, rows, response)
+    return rows
+
+
+def _parse_csv(content, columns, dtype):
+    """CSV body to a DataFrame; runs on the worker pool."""
+    with timer("parse"):
+        if not content.strip():
+            return pd.DataFrame(columns=columns.split(","))
+        return pd.read_csv(io.BytesIO(content), engine="c", dtype=dtype)
+
+
+async def select_keyset(table, columns, filters=(), key=("timestamp", "id"), page_size=PAGE_SIZE, dtype=None):
+    """Page through a large range ordered by ``key`` into one DataFrame.
+
+    Each page continues strictly after the last row of the previous one, so
+    the database can seek on the index instead of skipping an OFFSET. ``key``
+    must be unique, or rows tied with a page's last row would be skipped;
+    the default orders by timestamp and breaks ties on the primary key.
+    """
+    order = ",".join(f"{column}.asc" for column in key)
+    pages = []
+    after = None
+    while True:
+        page_filters = list(filters)
+        if after is not None:
+            page_filters.append(_after(key, after))
+        page = await select_csv(table, columns, page_filters, order=order, limit=page_size, dtype=dtype)
+        pages.append(page)
+        if len(page) < page_size:
+            return await run_cpu(pd.concat, pages, ignore_index=True) if len(pages) > 1 else page
+        after = [page[column].iloc[-1] for column in key]
+
+
+def _after(key, values):
+    """Filter for rows strictly after ``values`` in ``key`` order."""
+    values = [_quote(v) for v in values]
+    if len(key) == 1:
+        return key[0], f"gt.{values[0]}"
+    terms = []
+    for i, column in enumerate(key):
+        tied = [f"{c}.eq.{v}" for c, v in zip(key[:i], values)]
+        term = f"{column}.gt.{values[i]}"
+        terms.append(f"and({','.join(tied + [term])})" if tied else term)
+    return "or", f"({','.join(terms)})"
+
+
+def _count(table, rows, response):
+    QUERY_ROWS.observe(len(rows), table=table)
+    ROWS_FETCHED.inc(len(rows), table=table)
+    BYTES_FETCHED.inc(len(response.content), table=table)
+
+
+def _quote(value):
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
@@ -0,0 +1,45 @@
+import numpy as np
+
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets downsampling.
+
+    Returns the indices of the points to keep so the caller can slice any
+    number of aligned columns with the same selection.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    every = (n - 2) / (threshold - 2)
+    edges = (np.floor(np.arange(threshold - 1) * every) + 1).astype(np.int64)
+    edges[-1] = n - 1
+
+    # The average of the following bucket does not depend on what was
+    # picked before, so all of them are computed up front
+    next_lo = edges[1:]
+    next_hi = np.append(edges[2:], n)
+    sum_x = np.add.reduceat(x, next_lo)
+    sum_y = np.add.reduceat(y, next_lo)
+    count = next_hi - next_lo
+    avg_x = sum_x / count
+    avg_y = sum_y / count
+
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs(
+            (ax - avg_x[i]) * (y[start:end] - ay) - (ax - x[start:end]) * (avg_y[i] - ay)
+        )
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+
+    return keep
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+LIVE_POLL_SEC = float(os.getenv("LIVE_POLL_SEC", "5"))
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "32"))
+
+
+class Subscriber:
+    """One connected dashboard; events wait in a bounded queue."""
+
+    def __init__(self, size):
+        self.queue = asyncio.Queue(maxsize=size)
+        self.dropped = 0
+
+    def offer(self, event):
+        """Queue an event without ever blocking the poller.
+
+        A client too slow to drain its queue loses the backlog and is told
+        to reload the full series instead.
+        """
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(("resync", "{}"))
+
+
+class Broadcaster:
+    """Single poller that fans newly cached rows out to every subscriber.
+
+    The poller runs only while someone is subscribed and reads through the
+    shared SeriesCache, so live viewers add no database load beyond one
+    delta refill per interval. Rows that turn up behind what was already
+    pushed cannot be appended in order, so they trigger a ``resync`` that
+    makes every dashboard reload the series instead.
+    """
+
+    def __init__(self, cache, interval=LIVE_POLL_SEC, queue_size=LIVE_QUEUE_SIZE):
+        self._cache = cache
+        self._interval = interval
+        self._queue_size = queue_size
+        self._subscribers = set()
+        self._task = None
+        self.stats = {"polls": 0, "poll_errors": 0, "events": 0, "rows_pushed": 0, "resyncs": 0, "late_resyncs": 0}
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        subscriber = Subscriber(self._queue_size)
+        self._subscribers.add(subscriber)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+        if subscriber.dropped:
+            self.stats["resyncs"] += 1
+        if not self._subscribers:
+            self.stop()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def publish(self, event, data):
+        self.stats["events"] += 1
+        for subscriber in list(self._subscribers):
+            subscriber.offer((event, data))
+
+    async def _run(self):
+        cursor = {}
+        started_ns = int(datetime.now(timezone.utc).timestamp() * 1e9)
+        while True:
+            try:
+                await self._cache.refresh(datetime.now(timezone.utc) - timedelta(seconds=self._interval * 2))
+                self.stats["polls"] += 1
+                rows, late = self._cache.rows_after(cursor, started_ns)
+                if late:
+                    self.stats["late_resyncs"] += 1
+                    self.publish("resync", "{}")
+                elif rows:
+                    self.stats["rows_pushed"] += sum(len(ts) for ts, _, _ in rows.values())
+                    self.publish("rows", encode_rows(rows))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["poll_errors"] += 1
+                print(f"[ERROR] Live poll failed: {e}")
+            await asyncio.sleep(self._interval)
+
+
+def encode_rows(rows):
+    """JSON body for a ``rows`` event: epoch-ms timestamps and values per sensor."""
+    return json.dumps({
+        "sensors": [
+            {
+                "id": sensor_id,
+                "t": (ts // 1_000_000).tolist(),
+                "raw_value": np.round(raw_value.astype(np.float64), 3).tolist(),
+                "voltage": np.round(voltage.astype(np.float64), 3).tolist(),
+            }
+            for sensor_id, (ts, raw_value, voltage) in rows.items()
+        ]
+    }, separators=(",", ":"))
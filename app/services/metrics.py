@@ -0,0 +1,132 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from urllib.parse import parse_qs
+
+# The metric types live in the top-level metrics module, which the ingester
+# uses without pulling in the web app's stage and HTTP metrics; the app
+# imports them from here
+from metrics import LATENCY_BUCKETS, ROWS_BUCKETS, SIZE_BUCKETS, Counter, Gauge, Histogram, render
+
+__all__ = [
+    "LATENCY_BUCKETS", "ROWS_BUCKETS", "SIZE_BUCKETS", "Counter", "Gauge", "Histogram", "render",
+    "PROFILE_REQUESTS", "STAGE_SECONDS", "timer", "collapsed_stacks",
+    "REQUEST_SECONDS", "RESPONSE_BYTES", "MetricsMiddleware",
+]
+
+# Profile every request, or only those with ?profile=1
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0") == "1"
+
+
+# Per-stage timing ---------------------------------------------------------
+
+STAGE_SECONDS = Histogram("homesense_stage_seconds", "Time spent per named stage", ["stage"])
+
+_stack = contextvars.ContextVar("metrics_stack", default=())
+_profile = contextvars.ContextVar("metrics_profile", default=None)
+
+
+@contextmanager
+def timer(stage):
+    """Time a stage into STAGE_SECONDS and, when profiling, the request's profile.
+
+    Nested timers form a path such as refill;query;parse, which is what
+    the flame-style profile dump is built from.
+    """
+    path = _stack.get() + (stage,)
+    token = _stack.set(path)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _stack.reset(token)
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        profile = _profile.get()
+        if profile is not None:
+            profile.append((path, elapsed))
+
+
+def _totals(profile):
+    totals = {}
+    for path, elapsed in profile:
+        totals[path] = totals.get(path, 0.0) + elapsed
+    return totals
+
+
+def collapsed_stacks(root, profile, total):
+    """Flame-graph 'collapsed stack' lines with self time in microseconds."""
+    totals = _totals(profile)
+    children = {}
+    for path, elapsed in totals.items():
+        if len(path) > 1:
+            children[path[:-1]] = children.get(path[:-1], 0.0) + elapsed
+    lines = []
+    for path, elapsed in totals.items():
+        self_time = max(0.0, elapsed - children.get(path, 0.0))
+        lines.append(f"{';'.join((root, *path))} {int(self_time * 1e6)}")
+    untimed = total - sum(elapsed for path, elapsed in totals.items() if len(path) == 1)
+    lines.append(f"{root} {int(max(0.0, untimed) * 1e6)}")
+    return lines
+
+
+# HTTP ---------------------------------------------------------------------
+
+REQUEST_SECONDS = Histogram("homesense_http_request_seconds", "HTTP request latency", ["method", "route", "status"])
+RESPONSE_BYTES = Histogram("homesense_http_response_bytes", "HTTP response body size on the wire", ["route"], SIZE_BUCKETS)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and response size per route.
+
+    With PROFILE_REQUESTS=1 or ?profile=1 the request's stage timers are
+    printed as collapsed stacks (ready for flamegraph.pl or speedscope)
+    and summarised in a Server-Timing header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = token = None
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        if PROFILE_REQUESTS or query.get("profile") == ["1"]:
+            profile = []
+            token = _profile.set(profile)
+
+        start = time.perf_counter()
+        status = [500]
+        size = [0]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if profile is not None:
+                    timing = ", ".join(
+                        f"{path[0]};dur={elapsed * 1000:.1f}"
+                        for path, elapsed in _totals(profile).items() if len(path) == 1
+                    )
+                    if timing:
+                        message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode())]
+            elif message["type"] == "http.response.body":
+                size[0] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(elapsed, method=scope["method"], route=route, status=status[0])
+            RESPONSE_BYTES.observe(size[0], route=route)
+            if profile is not None:
+                _profile.reset(token)
+                root = f"{scope['method']} {route}"
+                print(f"⏱ {root} {elapsed * 1000:.1f} ms")
+                for line in collapsed_stacks(root, profile, elapsed):
+                    print(f"⏱ {line}")
@@ -0,0 +1,181 @@
+import threading
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from app.services.downsample import lttb
+
+FIELDS = ("raw_value", "voltage")
+
+# (name, bucket width, how long the tier is kept)
+TIERS = (
+    ("1min", timedelta(minutes=1), timedelta(days=7)),
+    ("15min", timedelta(minutes=15), timedelta(days=90)),
+    ("1h", timedelta(hours=1), timedelta(days=365)),
+)
+
+CHART_WIDTH_PX = 1200
+MAX_POINTS_PER_TRACE = 2000
+
+# Every tier's buckets start on a multiple of this, so spans aligned to it
+# never split a bucket
+ALIGN = max(bucket for _, bucket, _ in TIERS)
+
+_AGGS = ("min", "max", "sum", "count")
+_EMPTY_TS = np.empty(0, dtype=np.int64)
+
+
+class _Buckets:
+    """One sensor's tier: bucket starts (epoch ns) and an array per (field, agg)."""
+
+    __slots__ = ("ts", "columns")
+
+    def __init__(self, ts, columns):
+        self.ts = ts
+        self.columns = columns
+
+    @classmethod
+    def aggregate(cls, ts, values, bucket_ns):
+        """Buckets of rows sorted by ``ts``; NaN readings are left out."""
+        keys = ts - ts % bucket_ns
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else _EMPTY_TS
+        columns = {}
+        for field, value in zip(FIELDS, values):
+            value = value.astype(np.float64)
+            valid = ~np.isnan(value)
+            if not len(starts):
+                for agg in _AGGS:
+                    columns[(field, agg)] = np.empty(0, dtype=np.int64 if agg == "count" else np.float64)
+                continue
+            columns[(field, "min")] = np.fmin.reduceat(value, starts)
+            columns[(field, "max")] = np.fmax.reduceat(value, starts)
+            columns[(field, "sum")] = np.add.reduceat(np.where(valid, value, 0.0), starts)
+            columns[(field, "count")] = np.add.reduceat(valid.astype(np.int64), starts)
+        return cls(keys[starts], columns)
+
+    def splice(self, other, start_ns, end_ns):
+        """These buckets with [start_ns, end_ns) replaced by ``other``."""
+        lo = np.searchsorted(self.ts, start_ns, side="left")
+        hi = len(self.ts) if end_ns is None else np.searchsorted(self.ts, end_ns, side="left")
+        return _Buckets(
+            np.concatenate((self.ts[:lo], other.ts, self.ts[hi:])),
+            {key: np.concatenate((col[:lo], other.columns[key], col[hi:])) for key, col in self.columns.items()},
+        )
+
+    def since(self, cutoff_ns):
+        lo = np.searchsorted(self.ts, cutoff_ns, side="left")
+        return _Buckets(self.ts[lo:], {key: column[lo:] for key, column in self.columns.items()})
+
+
+class RollupStore:
+    """Per-sensor min/max/mean buckets at several resolutions.
+
+    Buckets are rebuilt span by span: ``ingest`` gets every row of a span
+    aligned to ALIGN, aggregates just that span and splices the result over
+    the buckets it replaces. Late rows therefore land in the bucket they
+    belong to, and feeding the same rows twice does not count them twice.
+    """
+
+    def __init__(self):
+        self._buckets = {}  # (sensor_id, tier name) -> _Buckets
+        self._lock = threading.Lock()
+
+    def ingest(self, spans, start, end=None):
+        """Replace the buckets in [start, end) with aggregates of ``spans``.
+
+        ``spans`` maps sensor_id to (epoch ns timestamps, raw_value, voltage)
+        arrays holding all of that sensor's rows in the span, in timestamp
+        order; ``end=None`` means everything from ``start`` on.
+        """
+        start_ns = pd.Timestamp(start).value
+        end_ns = None if end is None else pd.Timestamp(end).value
+        rebuilt = {
+            (sensor_id, name): _Buckets.aggregate(ts, values, pd.Timedelta(bucket).value)
+            for sensor_id, (ts, *values) in spans.items()
+            for name, bucket, retention in TIERS
+            if not self._expired(sensor_id, name, retention, end_ns)
+        }
+        with self._lock:
+            for (sensor_id, name), buckets in rebuilt.items():
+                self._splice(sensor_id, name, buckets, start_ns, end_ns)
+
+    def _expired(self, sensor_id, name, retention, end_ns):
+        """True when the whole span is older than the tier keeps anyway."""
+        existing = self._buckets.get((sensor_id, name))
+        if end_ns is None or existing is None or not len(existing.ts):
+            return False
+        return end_ns <= existing.ts[-1] - pd.Timedelta(retention).value
+
+    def _splice(self, sensor_id, name, buckets, start_ns, end_ns):
+        existing = self._buckets.get((sensor_id, name))
+        if existing is not None:
+            buckets = existing.splice(buckets, start_ns, end_ns)
+        if not len(buckets.ts):
+            self._buckets.pop((sensor_id, name), None)
+            return
+        retention = next(r for tier, _, r in TIERS if tier == name)
+        self._buckets[(sensor_id, name)] = buckets.since(buckets.ts[-1] - pd.Timedelta(retention).value)
+
+    def series(self, sensor_id, tier, start, end):
+        """Mean/min/max per bucket for one sensor between start and end."""
+        with self._lock:
+            buckets = self._buckets.get((sensor_id, tier))
+        if buckets is None:
+            buckets = _Buckets.aggregate(_EMPTY_TS, [np.empty(0)] * len(FIELDS), 1)
+
+        lo = np.searchsorted(buckets.ts, pd.Timestamp(start).value, side="left")
+        hi = np.searchsorted(buckets.ts, pd.Timestamp(end).value, side="right")
+        out = pd.DataFrame({"timestamp": pd.to_datetime(buckets.ts[lo:hi], utc=True)})
+        for field in FIELDS:
+            count = buckets.columns[(field, "count")][lo:hi]
+            out[field] = buckets.columns[(field, "sum")][lo:hi] / np.where(count == 0, np.nan, count)
+            out[f"{field}_min"] = buckets.columns[(field, "min")][lo:hi]
+            out[f"{field}_max"] = buckets.columns[(field, "max")][lo:hi]
+        return out
+
+
+def choose_tier(n_raw, start, end, width=CHART_WIDTH_PX, raw_start=None):
+    """Coarsest tier that still has at least one bucket per chart pixel.
+
+    Returns None when the raw rows should be plotted directly, either because
+    they already fit or because no tier is fine enough for the range. When
+    the raw rows only reach back to ``raw_start`` a tier is always used: the
+    finest one covering the range if none has a bucket per pixel.
+    """
+    raw_complete = raw_start is None or raw_start <= start
+    if raw_complete and n_raw <= MAX_POINTS_PER_TRACE:
+        return None
+    span = end - start
+    for name, bucket, retention in reversed(TIERS):
+        if span <= retention and span / bucket >= width:
+            return name
+    if raw_complete:
+        return None
+    return next((name for name, _, retention in TIERS if span <= retention), None)
+
+
+def chart_series(store, rows, sensor_id, field, start, end, raw_start=None):
+    """Timestamps, values and min/max envelope for one trace.
+
+    The line is capped at MAX_POINTS_PER_TRACE. Each kept point's envelope
+    spans every bucket (or raw row) up to the next kept point, so spikes
+    that LTTB or the bucket means smooth away stay visible. ``lo``/``hi``
+    are None when every raw row is drawn as is. ``raw_start`` is where
+    ``rows`` begin if that is later than ``start``.
+    """
+    tier = choose_tier(len(rows), start, end, raw_start=raw_start)
+    if tier is not None:
+        rows = store.series(sensor_id, tier, start, end)
+        lows, highs = rows[f"{field}_min"].to_numpy(), rows[f"{field}_max"].to_numpy()
+    else:
+        lows = highs = rows[field].to_numpy()
+
+    x = rows["timestamp"].reset_index(drop=True)
+    y = rows[field].to_numpy()
+    keep = lttb(x.astype("int64").to_numpy(), y, MAX_POINTS_PER_TRACE)
+    if tier is None and len(keep) == len(y):
+        return x, y, None, None
+    if not len(keep):
+        return x.iloc[keep], y[keep], lows[keep], highs[keep]
+    return x.iloc[keep], y[keep], np.minimum.reduceat(lows, keep), np.maximum.reduceat(highs, keep)
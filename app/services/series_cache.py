@@ -0,0 +1,380 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from app.services.metrics import timer
+from app.services.workers import run_cpu
+
+CACHE_DAYS = int(os.getenv("SERIES_CACHE_DAYS", "30"))
+MIN_REFRESH_SEC = float(os.getenv("SERIES_CACHE_MIN_REFRESH_SEC", "2"))
+
+_EMPTY_TS = np.empty(0, dtype=np.int64)
+_EMPTY_VALUES = np.empty(0, dtype=np.float32)
+
+
+class _SensorSeries:
+    __slots__ = ("ts", "raw_value", "voltage")
+
+    def __init__(self):
+        self.ts = _EMPTY_TS
+        self.raw_value = _EMPTY_VALUES
+        self.voltage = _EMPTY_VALUES
+
+    def replace_from(self, since_ns, ts, raw_value, voltage, until_ns=None):
+        """Swap the cached rows in [since_ns, until_ns) for freshly fetched ones."""
+        lo = np.searchsorted(self.ts, since_ns, side="left")
+        hi = len(self.ts) if until_ns is None else np.searchsorted(self.ts, until_ns, side="left")
+        self.ts = np.concatenate((self.ts[:lo], ts, self.ts[hi:]))
+        self.raw_value = np.concatenate((self.raw_value[:lo], raw_value, self.raw_value[hi:]))
+        self.voltage = np.concatenate((self.voltage[:lo], voltage, self.voltage[hi:]))
+
+    def merge(self, ts, raw_value, voltage):
+        """Add new rows in any timestamp order, e.g. readings uploaded late."""
+        lo = np.searchsorted(self.ts, ts.min(), side="right")
+        ts = np.concatenate((self.ts[lo:], ts))
+        order = np.argsort(ts, kind="stable")
+        self.ts = np.concatenate((self.ts[:lo], ts[order]))
+        self.raw_value = np.concatenate((self.raw_value[:lo], np.concatenate((self.raw_value[lo:], raw_value))[order]))
+        self.voltage = np.concatenate((self.voltage[:lo], np.concatenate((self.voltage[lo:], voltage))[order]))
+
+    def evict_before(self, cutoff_ns):
+        lo = np.searchsorted(self.ts, cutoff_ns, side="left")
+        if lo:
+            self.ts = self.ts[lo:]
+            self.raw_value = self.raw_value[lo:]
+            self.voltage = self.voltage[lo:]
+        return int(lo)
+
+    def frame(self, start_ns):
+        lo = np.searchsorted(self.ts, start_ns, side="left")
+        return pd.DataFrame({
+            "timestamp": pd.to_datetime(self.ts[lo:], utc=True),
+            "raw_value": self.raw_value[lo:],
+            "voltage": self.voltage[lo:],
+        })
+
+    def span(self, start_ns, end_ns=None):
+        lo = np.searchsorted(self.ts, start_ns, side="left")
+        hi = len(self.ts) if end_ns is None else np.searchsorted(self.ts, end_ns, side="left")
+        return self.ts[lo:hi], self.raw_value[lo:hi], self.voltage[lo:hi]
+
+
+class SeriesCache:
+    """Shared per-sensor window of turbidity readings.
+
+    ``fetch(since, until, max_id=None, after_id=None)`` is an async callable
+    returning a DataFrame of the rows with ``since <= timestamp < until``
+    (``until=None`` meaning up to now) and ``id <= max_id``, ordered by
+    timestamp; given ``after_id`` it returns the rows with ``id > after_id``
+    instead, ordered by id. ``latest_id()`` returns the newest id.
+
+    Ranges are loaded up to the id that was newest before the first fill.
+    After that only rows inserted since the last refill are asked for, by
+    id, so readings uploaded hours after they were taken still show up.
+    Concurrent callers share a single in-flight refill.
+
+    After every load ``on_rows(spans, start, end)`` gets all cached rows
+    per sensor, as (ts, raw_value, voltage) arrays, in the loaded range
+    widened to multiples of ``align``. It sees rows fetched earlier in the
+    same span as well as the new ones.
+    """
+
+    def __init__(self, fetch, latest_id, window=timedelta(days=CACHE_DAYS), min_refresh=MIN_REFRESH_SEC,
+                 on_rows=None, align=timedelta(hours=1)):
+        self._fetch = fetch
+        self._latest_id = latest_id
+        self.window = window
+        self._min_refresh = min_refresh
+        self._on_rows = on_rows
+        self._align_ns = pd.Timedelta(align).value
+        self._sensors = {}
+        self._floor = None  # earliest timestamp the cache is complete from
+        self._cursor = None  # every row up to this id is loaded
+        self._refilled_at = 0.0
+        self._inflight = None
+        # Bumped whenever the cached rows change; used for HTTP validators
+        self.version = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "shared": 0,
+            "refills": 0,
+            "refill_errors": 0,
+            "rows_fetched": 0,
+            "rows_evicted": 0,
+            "last_refill_ms": 0.0,
+            "max_refill_ms": 0.0,
+            "total_refill_ms": 0.0,
+        }
+
+    async def frames(self, start):
+        """Per-sensor DataFrames from ``start`` to now, refilled as needed."""
+        await self.refresh(start)
+        return self.window_frames(start)
+
+    async def refresh(self, start):
+        """Make sure the cache is complete from ``start`` and recently refilled."""
+        await self._refresh(self._clamp(start))
+
+    def window_frames(self, start):
+        """Per-sensor DataFrames from ``start`` as currently cached, no refill."""
+        start_ns = _to_ns(self._clamp(start))
+        return {sensor_id: series.frame(start_ns) for sensor_id, series in self._sensors.items()}
+
+    def rows_after(self, cursor, default_ns):
+        """Rows newer than the cursor per sensor, and whether any arrived behind it.
+
+        ``cursor`` maps sensor_id to (newest epoch ns sent, rows sent since
+        ``default_ns``) and is advanced in place; sensors it has not seen yet
+        start after ``default_ns``. When a sensor holds more rows up to its
+        cursor than were sent, a late upload was merged in behind it and the
+        second return value is True.
+        """
+        rows = {}
+        late = False
+        for sensor_id, series in self._sensors.items():
+            last_ns, sent = cursor.get(sensor_id, (default_ns, 0))
+            first = np.searchsorted(series.ts, default_ns, side="right")
+            lo = np.searchsorted(series.ts, last_ns, side="right")
+            if lo - first > sent:
+                late = True
+            if lo < len(series.ts):
+                rows[sensor_id] = (series.ts[lo:], series.raw_value[lo:], series.voltage[lo:])
+                last_ns = int(series.ts[-1])
+            cursor[sensor_id] = (last_ns, int(len(series.ts) - first))
+        return rows, late
+
+    def _clamp(self, start):
+        return max(start, datetime.now(timezone.utc) - self.window)
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats["avg_refill_ms"] = stats["total_refill_ms"] / stats["refills"] if stats["refills"] else 0.0
+        stats["sensors"] = len(self._sensors)
+        stats["rows_cached"] = sum(len(s.ts) for s in self._sensors.values())
+        stats["bytes_cached"] = sum(
+            s.ts.nbytes + s.raw_value.nbytes + s.voltage.nbytes for s in self._sensors.values()
+        )
+        return stats
+
+    def _is_fresh(self, start):
+        return (
+            self._floor is not None
+            and self._floor <= start
+            and time.monotonic() - self._refilled_at < self._min_refresh
+        )
+
+    async def _refresh(self, start):
+        counted = False
+        while True:
+            if self._inflight is not None:
+                if not counted:
+                    self.stats["shared"] += 1
+                    counted = True
+                await asyncio.shield(self._inflight)
+                if self._floor is not None and self._floor <= start:
+                    return
+                continue
+
+            if self._is_fresh(start):
+                if not counted:
+                    self.stats["hits"] += 1
+                return
+
+            if not counted:
+                self.stats["misses"] += 1
+            self._inflight = asyncio.ensure_future(self._refill(start))
+            try:
+                await asyncio.shield(self._inflight)
+            finally:
+                self._inflight = None
+            return
+
+    async def _refill(self, start):
+        began = time.perf_counter()
+        before = self._signature()
+        try:
+            with timer("refill"):
+                if self._floor is None:
+                    self._cursor = await self._latest_id()
+                    await self._load(start)
+                else:
+                    if start < self._floor:
+                        await self._load(start, until=self._floor)
+                    await self._load_new(min(start, self._floor))
+        except Exception:
+            self.stats["refill_errors"] += 1
+            raise
+
+        if self._floor is None or start < self._floor:
+            self._floor = start
+        self._evict()
+        self._refilled_at = time.monotonic()
+        if self._signature() != before:
+            self.version += 1
+
+        elapsed_ms = (time.perf_counter() - began) * 1000
+        self.stats["refills"] += 1
+        self.stats["last_refill_ms"] = elapsed_ms
+        self.stats["total_refill_ms"] += elapsed_ms
+        self.stats["max_refill_ms"] = max(self.stats["max_refill_ms"], elapsed_ms)
+
+    async def _load(self, since, until=None):
+        df = await self._fetch(since, until, max_id=self._cursor)
+        self.stats["rows_fetched"] += len(df)
+        groups = await run_cpu(self._parse, df)
+
+        since_ns = _to_ns(since)
+        until_ns = None if until is None else _to_ns(until)
+        for sensor_id in set(groups) | set(self._sensors):
+            series = self._sensors.setdefault(sensor_id, _SensorSeries())
+            ts, raw_value, voltage = groups.get(sensor_id, (_EMPTY_TS, _EMPTY_VALUES, _EMPTY_VALUES))
+            series.replace_from(since_ns, ts, raw_value, voltage, until_ns)
+        await self._emit(since_ns, until_ns)
+
+    async def _load_new(self, since):
+        """Merge in rows inserted after the cursor, whatever their timestamps."""
+        df = await self._fetch(since, after_id=self._cursor)
+        self.stats["rows_fetched"] += len(df)
+        if df.empty:
+            return
+        self._cursor = int(df["id"].max())
+        groups = await run_cpu(self._parse, df)
+
+        for sensor_id, (ts, raw_value, voltage) in groups.items():
+            self._sensors.setdefault(sensor_id, _SensorSeries()).merge(ts, raw_value, voltage)
+        await self._emit(min(int(ts.min()) for ts, _, _ in groups.values()), None)
+
+    async def _emit(self, start_ns, end_ns):
+        """Hand every cached row in [start_ns, end_ns), widened to ``align``, to on_rows."""
+        if self._on_rows is None:
+            return
+        start_ns -= start_ns % self._align_ns
+        if end_ns is not None:
+            end_ns -= end_ns % -self._align_ns
+        spans = {sensor_id: series.span(start_ns, end_ns) for sensor_id, series in self._sensors.items()}
+        await run_cpu(self._emit_rows, spans, start_ns, end_ns)
+
+    def _emit_rows(self, spans, start_ns, end_ns):
+        with timer("rollup_ingest"):
+            end = None if end_ns is None else pd.Timestamp(end_ns, tz="UTC")
+            self._on_rows(spans, pd.Timestamp(start_ns, tz="UTC"), end)
+
+    def _parse(self, df):
+        """Split fetched rows into per-sensor arrays; runs on the worker pool.
+
+        All sensors are separated in one pass: a stable sort on the sensor
+        codes keeps each sensor's rows in the server's order.
+        """
+        if df.empty:
+            return {}
+        with timer("to_datetime"):
+            df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True, format="ISO8601")
+
+        with timer("split"):
+            return self._split(df)
+
+    @staticmethod
+    def _split(df):
+        codes, sensor_ids = pd.factorize(df["sensor_id"])
+        order = np.argsort(codes, kind="stable")
+        bounds = np.cumsum(np.bincount(codes, minlength=len(sensor_ids)))[:-1]
+        ts = np.split(df["timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64)[order], bounds)
+        raw_value = np.split(df["raw_value"].to_numpy(dtype=np.float32)[order], bounds)
+        voltage = np.split(df["voltage"].to_numpy(dtype=np.float32)[order], bounds)
+        return {str(sensor_id): parts for sensor_id, *parts in zip(sensor_ids, ts, raw_value, voltage)}
+
+    def _signature(self):
+        rows = sum(len(s.ts) for s in self._sensors.values())
+        return self._cursor, rows, self.stats["rows_evicted"]
+
+    def _evict(self):
+        cutoff = datetime.now(timezone.utc) - self.window
+        cutoff_ns = _to_ns(cutoff)
+        for sensor_id in list(self._sensors):
+            series = self._sensors[sensor_id]
+            self.stats["rows_evicted"] += series.evict_before(cutoff_ns)
+            if not len(series.ts):
+                del self._sensors[sensor_id]
+        if self._floor is not None and self._floor < cutoff:
+            self._floor = cutoff
+
+
+class RollupBackfill:
+    """Fills the rollup tiers for ranges older than the raw cache window.
+
+    Rows before the cache window are fetched a chunk at a time, newest
+    first. Each chunk is aggregated on the worker pool and dropped, so only
+    the buckets are kept and the 15min/1h tiers can serve ranges the raw
+    cache does not hold. Concurrent callers share one fill, as with
+    SeriesCache.
+    """
+
+    def __init__(self, fetch, rollups, align=timedelta(hours=1), chunk=timedelta(days=1)):
+        self._fetch = fetch
+        self._rollups = rollups
+        self._align_ns = pd.Timedelta(align).value
+        self._chunk = chunk
+        self._floor = None  # earliest timestamp the tiers are complete from
+        self._inflight = None
+        # Bumped after every fill; part of the HTTP validators
+        self.version = 0
+        self.stats = {"fills": 0, "fill_errors": 0, "rows_fetched": 0, "last_fill_ms": 0.0}
+
+    async def fill(self, start, until):
+        """Make sure the tiers are complete from ``start`` up to ``until``.
+
+        ``until`` is where the raw cache begins; it is rounded up to a whole
+        bucket so the partial bucket the cache starts in is completed here.
+        """
+        start_ns = _to_ns(start)
+        start = pd.Timestamp(start_ns - start_ns % self._align_ns, tz="UTC")
+        until_ns = _to_ns(until)
+        until = pd.Timestamp(until_ns - until_ns % -self._align_ns, tz="UTC")
+        while True:
+            if start >= until or (self._floor is not None and self._floor <= start):
+                return
+            if self._inflight is not None:
+                await asyncio.shield(self._inflight)
+                continue
+            self._inflight = asyncio.ensure_future(self._fill(start, until))
+            try:
+                await asyncio.shield(self._inflight)
+            finally:
+                self._inflight = None
+            return
+
+    async def _fill(self, start, until):
+        began = time.perf_counter()
+        upper = until if self._floor is None else min(self._floor, until)
+        try:
+            with timer("backfill"):
+                while upper > start:
+                    lower = max(start, upper - self._chunk)
+                    df = await self._fetch(lower.to_pydatetime(), upper.to_pydatetime())
+                    self.stats["rows_fetched"] += len(df)
+                    await run_cpu(self._ingest, df, lower, upper)
+                    upper = self._floor = lower
+        except Exception:
+            self.stats["fill_errors"] += 1
+            raise
+        finally:
+            self.version += 1
+        self.stats["fills"] += 1
+        self.stats["last_fill_ms"] = (time.perf_counter() - began) * 1000
+
+    def _ingest(self, df, start, end):
+        with timer("rollup_ingest"):
+            spans = {}
+            if not df.empty:
+                df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True, format="ISO8601")
+                spans = SeriesCache._split(df)
+            self._rollups.ingest(spans, start, end)
+
+
+def _to_ns(dt):
+    return pd.Timestamp(dt).value
@@ -0,0 +1,31 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_PENDING = int(os.getenv("CPU_MAX_PENDING", str(CPU_WORKERS * 4)))
+
+_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="homesense-cpu")
+_slots = None
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Run DataFrame/figure work on the worker pool instead of the event loop.
+
+    At most MAX_PENDING jobs are queued or running at once; further callers
+    wait here, so a burst of requests cannot pile unbounded work on the pool.
+    """
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(MAX_PENDING)
+    async with _slots:
+        loop = asyncio.get_running_loop()
+        # Carry the caller's context so stage timers reach its profile
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(_executor, partial(context.run, fn, *args, **kwargs))
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
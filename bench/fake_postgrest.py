@@ -0,0 +1,156 @@
+import io
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import numpy as np
+import pandas as pd
+
+_KEYSET = re.compile(r'^\(timestamp\.gt\."([^"]+)",and\(timestamp\.eq\."[^"]+",id\.gt\."([^"]+)"\)\)$')
+COLUMNS = ["id", "sensor_id", "timestamp", "raw_value", "voltage"]
+
+
+class FakeTurbidityTable:
+    """In-memory stand-in for the turbidity_data table behind PostgREST.
+
+    Supports exactly what the app and ingester send: column projection,
+    ``timestamp`` gte/lt and ``id`` gt/lte filters, the (timestamp, id)
+    keyset ``or`` filter, ordering by timestamp or by ``id``, ``limit``, JSON
+    or CSV output, and bulk POST inserts. ``id`` is the primary key and
+    grows in insertion order.
+    """
+
+    def __init__(self, rows, sensors, days=7, interval_sec=None, end=None, rtt_ms=0.0, seed=0):
+        rng = np.random.default_rng(seed)
+        end = end or datetime.now(timezone.utc)
+        per_sensor = max(1, rows // sensors)
+        span_ns = int(timedelta(days=days).total_seconds() * 1e9)
+        step_ns = int(interval_sec * 1e9) if interval_sec else span_ns // per_sensor
+
+        end_ns = pd.Timestamp(end).value
+        ticks = end_ns - step_ns * np.arange(per_sensor, 0, -1, dtype=np.int64)
+        sensor_ids = np.array([f"Sensor{i + 1}" for i in range(sensors)])
+
+        # Rows ordered by (timestamp, id) like the server's index
+        sensor_order = np.argsort(sensor_ids)
+        self.ts = np.repeat(ticks, sensors)
+        self.sensor_id = np.tile(sensor_ids[sensor_order], per_sensor)
+        n = len(self.ts)
+        self.id = np.arange(1, n + 1, dtype=np.int64)
+        self._by_id = np.arange(n)
+        self.raw_value = rng.integers(14000, 16000, n).astype(np.float32)
+        self.voltage = np.round(3.3 * self.raw_value / 20000, 2).astype(np.float32)
+        self.timestamp = pd.to_datetime(self.ts, utc=True).strftime("%Y-%m-%d %H:%M:%S.%f+00").to_numpy()
+
+        self.rtt = rtt_ms / 1000
+        self.inserted = []
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ts)
+
+    def insert(self, rows):
+        """Add rows as the server would store them, e.g. a late commit."""
+        ts = pd.to_datetime([row["timestamp"] for row in rows], utc=True, format="ISO8601")
+        with self._lock:
+            self.id = np.concatenate((self.id, self.id.max() + 1 + np.arange(len(rows), dtype=np.int64)))
+            self.ts = np.concatenate((self.ts, ts.to_numpy(dtype="datetime64[ns]").view(np.int64)))
+            self.sensor_id = np.concatenate((self.sensor_id, [row["sensor_id"] for row in rows]))
+            self.raw_value = np.concatenate((self.raw_value, np.array([row["raw_value"] for row in rows], np.float32)))
+            self.voltage = np.concatenate((self.voltage, np.array([row["voltage"] for row in rows], np.float32)))
+            self.timestamp = np.concatenate((self.timestamp, ts.strftime("%Y-%m-%d %H:%M:%S.%f+00").to_numpy()))
+            order = np.lexsort((self.id, self.ts))
+            for column in ("ts", *COLUMNS):
+                setattr(self, column, getattr(self, column)[order])
+            self._by_id = np.argsort(self.id)
+
+    def transport(self):
+        return httpx.MockTransport(self.handle)
+
+    def handle(self, request):
+        if self.rtt:
+            time.sleep(self.rtt)
+        with self._lock:
+            self.requests += 1
+        if request.method == "POST":
+            rows = json.loads(request.content)
+            with self._lock:
+                self.inserted.append(len(rows))
+            return httpx.Response(201, json=[])
+
+        rows = self._rows(request.url.params)
+        columns = request.url.params.get("select", "*")
+        columns = COLUMNS if columns == "*" else columns.split(",")
+        page = pd.DataFrame({c: getattr(self, c)[rows] for c in columns})
+
+        if request.headers.get("accept") == "text/csv":
+            buffer = io.StringIO()
+            page.to_csv(buffer, index=False)
+            body = buffer.getvalue().encode()
+            content_type = "text/csv"
+        else:
+            body = page.to_json(orient="records").encode()
+            content_type = "application/json"
+        with self._lock:
+            self.bytes_sent += len(body)
+        return httpx.Response(200, content=body, headers={"Content-Type": content_type})
+
+    def _rows(self, params):
+        if params.get("order", "").startswith("id."):
+            return self._rows_by_id(params)
+
+        lo, hi = 0, len(self.ts)
+        for condition in params.get_list("timestamp"):
+            op, value = condition.split(".", 1)
+            at = pd.Timestamp(value).value
+            if op == "gte":
+                lo = max(lo, int(np.searchsorted(self.ts, at, side="left")))
+            elif op == "lt":
+                hi = min(hi, int(np.searchsorted(self.ts, at, side="left")))
+
+        keyset = params.get("or")
+        if keyset:
+            ts_value, id_value = _KEYSET.match(keyset).groups()
+            at, after = pd.Timestamp(ts_value).value, int(id_value)
+            start = int(np.searchsorted(self.ts, at, side="left"))
+            while start < len(self.ts) and self.ts[start] == at and self.id[start] <= after:
+                start += 1
+            lo = max(lo, start)
+
+        limit = int(params.get("limit") or len(self.ts))
+        if not params.get_list("id"):
+            return slice(lo, max(lo, min(hi, lo + limit)))
+        # Widen the window until enough rows pass the id filter
+        width = limit
+        while True:
+            end = min(hi, lo + width)
+            rows = lo + np.flatnonzero(self._id_mask(params, self.id[lo:end]))
+            if len(rows) >= limit or end >= hi:
+                return rows[:limit]
+            width *= 2
+
+    def _rows_by_id(self, params):
+        rows = self._by_id
+        if params["order"] == "id.desc":
+            rows = rows[::-1]
+        rows = rows[self._id_mask(params, self.id[rows])]
+        for condition in params.get_list("timestamp"):
+            op, value = condition.split(".", 1)
+            at = pd.Timestamp(value).value
+            rows = rows[self.ts[rows] >= at] if op == "gte" else rows[self.ts[rows] < at]
+        limit = params.get("limit")
+        return rows[:int(limit)] if limit else rows
+
+    @staticmethod
+    def _id_mask(params, ids):
+        mask = np.ones(len(ids), dtype=bool)
+        for condition in params.get_list("id"):
+            op, value = condition.split(".", 1)
+            value = int(value.strip('"'))
+            mask &= ids > value if op == "gt" else ids <= value
+        return mask
@@ -0,0 +1,244 @@
+"""Dashboard and ingest benchmarks against a local PostgREST stand-in.
+
+    python -m bench.run                        # 10k, 100k and 1M rows
+    python -m bench.run --rows 100000 --clients 16
+    python -m bench.run --compare bench/results/<commit>.json
+
+Results are written to bench/results/<commit>.json.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+os.environ.setdefault("SUPABASE_URL", "http://fake-postgrest")
+os.environ.setdefault("SUPABASE_KEY", "bench")
+
+import httpx
+import numpy as np
+
+from bench.fake_postgrest import FakeTurbidityTable
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def reset_app_state(table):
+    """Point the app at a fresh fake table with empty caches."""
+    from app.api import data
+    from app.services import db, workers
+    from app.services.live import Broadcaster
+    from app.services.rollups import ALIGN, RollupStore
+    from app.services.series_cache import RollupBackfill, SeriesCache
+
+    workers._slots = None
+    db.set_client(httpx.AsyncClient(base_url=f"{db.SUPABASE_URL}/rest/v1", transport=table.transport()))
+    data.rollups = RollupStore()
+    data.series_cache = SeriesCache(data.fetch_turbidity, data.latest_turbidity_id, on_rows=data.rollups.ingest, align=ALIGN)
+    data.backfill = RollupBackfill(data.fetch_turbidity, data.rollups, align=ALIGN)
+    data.live = Broadcaster(data.series_cache)
+    data._payloads.clear()
+    return data
+
+
+async def bench_dashboard(rows, sensors, days, clients, requests):
+    table = FakeTurbidityTable(rows, sensors, days=days)
+    data = reset_app_state(table)
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/login", data={"username": "bench", "password": "bench"})
+        url = f"/api/series?days={days}"
+
+        started = time.perf_counter()
+        response = await client.get(url)
+        response.raise_for_status()
+        cold_ms = (time.perf_counter() - started) * 1000
+        db_requests = table.requests
+
+        latencies = []
+        sizes = []
+        wire_sizes = []
+
+        async def viewer():
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies=client.cookies) as own:
+                for _ in range(requests):
+                    began = time.perf_counter()
+                    r = await own.get(url, headers={"Accept-Encoding": "gzip"})
+                    latencies.append((time.perf_counter() - began) * 1000)
+                    sizes.append(len(r.content))
+                    wire_sizes.append(r.num_bytes_downloaded)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(viewer() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+        return {
+            "rows": len(table),
+            "sensors": sensors,
+            "days": days,
+            "clients": clients,
+            "requests": clients * requests,
+            "cold_ms": cold_ms,
+            "cold_db_requests": db_requests,
+            "cold_db_bytes": table.bytes_sent,
+            "p50_ms": percentile(latencies, 50),
+            "p99_ms": percentile(latencies, 99),
+            "max_ms": max(latencies),
+            "throughput_rps": len(latencies) / elapsed,
+            "response_bytes": int(np.mean(sizes)),
+            "response_gzip_bytes": int(np.mean(wire_sizes)),
+            "warm_db_requests": table.requests - db_requests,
+            "cache": data.series_cache.snapshot(),
+        }
+
+
+def bench_ingest(readings, sensors, batch_size, rtt_ms):
+    """Enqueue readings like the scheduler does, then time the uploader draining them.
+
+    Batches go through push_to_supabase.upload_batch, i.e. the supabase-py
+    upsert the device runs, with its client pointed at the fake table.
+    """
+    from supabase import ClientOptions, create_client
+
+    import push_to_supabase
+    from upload_queue import UploadQueue, Uploader
+
+    table = FakeTurbidityTable(1, 1, rtt_ms=rtt_ms)
+    device_client = push_to_supabase.supabase
+    push_to_supabase.supabase = create_client(
+        os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"],
+        options=ClientOptions(httpx_client=httpx.Client(transport=table.transport())),
+    )
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = UploadQueue(os.path.join(tmp, "queue.sqlite3"))
+            ticks = readings // sensors
+            started = time.perf_counter()
+            for tick in range(ticks):
+                timestamp = datetime.fromtimestamp(tick, tz=timezone.utc).isoformat()
+                queue.put("RP1", [
+                    {"sensor_id": f"Sensor{i + 1}", "timestamp": timestamp, "raw_value": 15000, "voltage": 2.48,
+                     "site": "SiteA", "sensor_type": "turbidity"}
+                    for i in range(sensors)
+                ])
+            enqueue_sec = time.perf_counter() - started
+
+            # Drain the backlog as the uploader would after an outage
+            uploader = Uploader(queue, push_to_supabase.upload_batch, batch_size=batch_size, linger=0)
+            started = time.perf_counter()
+            uploader.start()
+            while queue.depth():
+                time.sleep(0.01)
+            drain_sec = time.perf_counter() - started
+            uploader.stop()
+            uploader.join()
+            queue.close()
+    finally:
+        push_to_supabase.supabase = device_client
+
+    total = ticks * sensors
+    return {
+        "readings": total,
+        "sensors": sensors,
+        "batch_size": batch_size,
+        "rtt_ms": rtt_ms,
+        "enqueue_rows_per_sec": total / enqueue_sec,
+        "upload_rows_per_sec": total / drain_sec,
+        "upload_requests": len(table.inserted),
+        "mean_batch_rows": float(np.mean(table.inserted)) if table.inserted else 0.0,
+        "batch_fill": (float(np.mean(table.inserted)) / batch_size) if table.inserted else 0.0,
+        "rows_per_request_vs_per_tick": (total / len(table.inserted)) / sensors if table.inserted else 0.0,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    old = {(r["rows"], r["sensors"]): r for r in baseline["dashboard"]}
+    print(f"\nvs {baseline['commit']}:")
+    for result in current["dashboard"]:
+        previous = old.get((result["rows"], result["sensors"]))
+        if not previous:
+            continue
+        deltas = ", ".join(
+            f"{key} {(result[key] - previous[key]) / previous[key] * 100:+.1f}%"
+            for key in ("cold_ms", "p50_ms", "p99_ms", "response_gzip_bytes")
+            if previous[key]
+        )
+        print(f"  {result['rows']:>9} rows: {deltas}")
+    if baseline.get("ingest") and current.get("ingest") and baseline["ingest"]["upload_rows_per_sec"]:
+        change = current["ingest"]["upload_rows_per_sec"] / baseline["ingest"]["upload_rows_per_sec"] - 1
+        print(f"  ingest upload_rows_per_sec {change * 100:+.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--sensors", type=int, default=20)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=10, help="requests per client")
+    parser.add_argument("--ingest-readings", type=int, default=50_000)
+    parser.add_argument("--ingest-batch", type=int, default=500)
+    parser.add_argument("--ingest-rtt-ms", type=float, default=20.0)
+    parser.add_argument("--out", help="result file (default bench/results/<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to diff against")
+    args = parser.parse_args(argv)
+
+    results = {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "dashboard": [],
+        "ingest": None,
+    }
+
+    for rows in args.rows:
+        result = asyncio.run(bench_dashboard(rows, args.sensors, args.days, args.clients, args.requests))
+        results["dashboard"].append(result)
+        print(
+            f"dashboard {result['rows']:>9} rows: cold {result['cold_ms']:8.1f} ms, "
+            f"p50 {result['p50_ms']:7.1f} ms, p99 {result['p99_ms']:7.1f} ms, "
+            f"{result['response_gzip_bytes'] / 1024:7.1f} KiB gzip ({result['response_bytes'] / 1024:.1f} KiB)"
+        )
+
+    ingest = bench_ingest(args.ingest_readings, args.sensors, args.ingest_batch, args.ingest_rtt_ms)
+    results["ingest"] = ingest
+    print(
+        f"ingest {ingest['readings']} readings: enqueue {ingest['enqueue_rows_per_sec']:,.0f} rows/s, "
+        f"upload {ingest['upload_rows_per_sec']:,.0f} rows/s in {ingest['upload_requests']} requests "
+        f"({ingest['batch_fill'] * 100:.0f}% batch fill)"
+    )
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2, default=float)
+    print(f"Saved {out}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
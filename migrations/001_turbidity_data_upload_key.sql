@@ -0,0 +1,20 @@
+-- Unique key for the ingester's idempotent upserts (see upload_queue.py).
+-- push_to_supabase.upload_batch upserts with
+-- on_conflict=site,sensor_type,sensor_id,timestamp, which PostgREST can only
+-- resolve against a unique index on exactly these columns.
+
+begin;
+
+-- Keep the first copy of any reading stored twice before the key existed
+delete from turbidity_data a
+    using turbidity_data b
+    where a.ctid > b.ctid
+      and a.site = b.site
+      and a.sensor_type = b.sensor_type
+      and a.sensor_id = b.sensor_id
+      and a."timestamp" = b."timestamp";
+
+create unique index if not exists turbidity_data_upload_key
+    on turbidity_data (site, sensor_type, sensor_id, "timestamp");
+
+commit;
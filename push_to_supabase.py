@@ -1,7 +1,11 @@
-import time
+import os
 from datetime import datetime, timezone
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions
+from postgrest.exceptions import APIError
 import random
+from scheduler import SamplingScheduler
+from upload_queue import REJECTED_STATUSES, RejectedBatch, UploadQueue, Uploader
+import metrics
 
 # Supabase credentials
 SUPABASE_URL = "https://jqoukirgtuhkuibvulni.supabase.co"
@@ -9,6 +13,13 @@ SUPABASE_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJpc3MiOiJzdXBhYmFzZSIsInJ
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Config reads get their own client with a short timeout instead of the
+# 120 s default; a slow answer just keeps the previous configs a bit longer
+CONFIG_TIMEOUT_SEC = float(os.getenv("CONFIG_TIMEOUT_SEC", "5"))
+config_client: Client = create_client(
+    SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(postgrest_client_timeout=CONFIG_TIMEOUT_SEC)
+)
+
 DEVICE_ID = "RP1"
 SITE_NAME = "SiteA"
 
@@ -18,84 +29,112 @@ SENSOR_MAP = {
     # Add more sensor types as needed
 }
 
-CONFIG_CACHE = {}  # sensor_type -> (timestamp, config)
-
-def get_config(sensor_type):
-    now = time.time()
-    cache = CONFIG_CACHE.get(sensor_type)
-
-    if cache and now - cache[0] < 10:
-        return cache[1]
-
+def get_configs():
+    # One query for every sensor type of this device
     try:
-        response = supabase.table("device_config") \
-            .select("interval_sec, enabled") \
+        response = config_client.table("device_config") \
+            .select("sensor_type, interval_sec, enabled") \
             .eq("device_id", DEVICE_ID) \
-            .eq("sensor_type", sensor_type) \
             .execute()
-
-        data = response.data
-
-        if len(data) != 1:
-            CONFIG_CACHE[sensor_type] = (now, None)
-            return None
-
-        CONFIG_CACHE[sensor_type] = (now, data[0])
-        return data[0]
-
     except Exception as e:
-        print(f"[ERROR] {sensor_type}: Could not fetch config: {e}")
+        print(f"[ERROR] Could not fetch configs: {e}")
         return None
 
-def round_timestamp(interval_sec):
-    now = datetime.now(timezone.utc)
-    rounded = round(now.timestamp() / interval_sec) * interval_sec
-    return datetime.fromtimestamp(rounded, tz=timezone.utc).isoformat()
+    configs = {}
+    for row in response.data:
+        if row["sensor_type"] in configs:
+            # Same rule as before: ambiguous config disables the type
+            configs[row["sensor_type"]] = None
+        else:
+            configs[row["sensor_type"]] = row
+    return configs
 
 def read_sensor(sensor_type, sensor_id):
     raw_value = random.randint(14000, 16000)
     voltage = round(3.3 * raw_value / 20000, 2)
     return raw_value, voltage
 
-def upload_batch(sensor_data, sensor_type, timestamp):
-    try:
-        for entry in sensor_data:
-            entry.update({
-                "timestamp": timestamp,
-                "site": SITE_NAME,
-                "sensor_type": sensor_type
-            })
-        supabase.table("turbidity_data").insert(sensor_data).execute()
-    except Exception as e:
-        print(f"[ERROR] Failed to upload {sensor_type} batch: {e}")
+# Prometheus exporter on this port when set, e.g. METRICS_PORT=9101
+METRICS_PORT = os.getenv("METRICS_PORT")
 
-if __name__ == "__main__":
-    last_run = {}
-
-    while True:
-        for sensor_type, sensor_ids in SENSOR_MAP.items():
-            config = get_config(sensor_type)
-            if not config or not config["enabled"]:
-                continue
-
-            interval = config["interval_sec"]
-            now = time.time()
-            last = last_run.get(sensor_type, 0)
-
-            if now - last >= interval:
-                # Use rounded timestamp for alignment
-                timestamp = round_timestamp(interval)
-
-                sensor_data = []
-                for sensor_id in sensor_ids:
-                    raw, volt = read_sensor(sensor_type, sensor_id)
-                    sensor_data.append({
-                        "sensor_id": sensor_id,
-                        "raw_value": raw,
-                        "voltage": volt
-                    })
+UPLOAD_SECONDS = metrics.Histogram("homesense_upload_seconds", "Bulk insert round-trip latency")
+UPLOAD_ROWS = metrics.Histogram("homesense_upload_batch_rows", "Readings per bulk insert", buckets=metrics.ROWS_BUCKETS)
 
-                upload_batch(sensor_data, sensor_type, timestamp)
-                last_run[sensor_type] = now
+# Error codes that can be caused by the readings themselves: PostgREST's
+# request errors (PGRST1xx) and Postgres data (22) and integrity (23)
+# errors. Schema, permission and missing-key errors (PGRST2xx, 42xxx) hit
+# every batch alike and are retried until fixed.
+CLIENT_ERROR_CODES = ("PGRST1", "22", "23")
 
-        time.sleep(1)
+def is_client_error(error):
+    code = str(error.code or "")
+    if len(code) == 3 and code.isdigit():
+        # Non-JSON error bodies carry the HTTP status instead
+        return int(code) in REJECTED_STATUSES
+    return code.startswith(CLIENT_ERROR_CODES)
+
+def upload_batch(rows):
+    # Idempotent bulk write on the key from migrations/001_turbidity_data_upload_key.sql
+    try:
+        with UPLOAD_SECONDS.time():
+            supabase.table("turbidity_data") \
+                .upsert(rows, on_conflict="site,sensor_type,sensor_id,timestamp", ignore_duplicates=True) \
+                .execute()
+    except APIError as e:
+        if is_client_error(e):
+            raise RejectedBatch(str(e)) from e
+        raise
+    UPLOAD_ROWS.observe(len(rows))
+
+def register_metrics(queue, uploader, scheduler):
+    metrics.Gauge("homesense_upload_queue_depth", "Readings waiting in the local queue",
+                  callback=lambda: {(): queue.depth()})
+    metrics.Gauge("homesense_upload_queue_bytes", "Disk used by the local queue",
+                  callback=lambda: {(): queue.size_bytes()})
+    metrics.Counter("homesense_upload_queue_dropped_total", "Readings dropped to stay within the disk budget",
+                    callback=lambda: {(): queue.dropped})
+    metrics.Counter("homesense_uploader_total", "Uploader batches, rows, failures and rejected readings", ["event"],
+                    callback=lambda: {(k,): uploader.stats[k] for k in ("batches", "rows", "failures", "rejected")})
+    metrics.Counter("homesense_sampling_total", "Sampling ticks, overruns, skipped ticks and read errors",
+                    ["sensor_type", "event"],
+                    callback=lambda: {
+                        (sensor_type, k): v
+                        for sensor_type, stats in list(scheduler.stats.items())
+                        for k, v in stats.items() if k != "max_late_ms"
+                    })
+    metrics.Gauge("homesense_sampling_max_late_ms", "Worst wake-up lateness per sensor type", ["sensor_type"],
+                  callback=lambda: {(t,): stats["max_late_ms"] for t, stats in list(scheduler.stats.items())})
+
+def queue_batch(queue, sensor_data, sensor_type, timestamp):
+    for entry in sensor_data:
+        entry.update({
+            "timestamp": timestamp,
+            "site": SITE_NAME,
+            "sensor_type": sensor_type
+        })
+    queue.put(DEVICE_ID, sensor_data)
+
+if __name__ == "__main__":
+    queue = UploadQueue()
+    uploader = Uploader(queue, upload_batch)
+    uploader.start()
+
+    def store_batch(sensor_type, deadline, readings):
+        # The deadline is already on the interval grid, so this is exact
+        timestamp = datetime.fromtimestamp(deadline, tz=timezone.utc).isoformat()
+        sensor_data = [
+            {"sensor_id": sensor_id, "raw_value": raw, "voltage": volt}
+            for sensor_id, (raw, volt) in readings
+        ]
+        queue_batch(queue, sensor_data, sensor_type, timestamp)
+
+    scheduler = SamplingScheduler(SENSOR_MAP, get_configs, read_sensor, store_batch)
+    register_metrics(queue, uploader, scheduler)
+    if METRICS_PORT:
+        metrics.start_http_server(int(METRICS_PORT))
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        scheduler.stop()
+        uploader.stop()
+        print(f"Scheduler stats: {scheduler.stats}")
@@ -0,0 +1,173 @@
+import heapq
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+CONFIG_TTL_SEC = 10
+READ_WORKERS = 8
+
+
+class SamplingScheduler:
+    """Deadline-heap scheduler for sensor reads.
+
+    Every sensor type is due at exact multiples of its interval since the
+    epoch, so tick k of a type is always at ``k * interval`` and never
+    drifts with the time spent sleeping, reading or uploading. At each
+    deadline all sensors of the type are read concurrently on a thread pool
+    and ``on_batch(sensor_type, deadline, readings)`` gets the results once
+    the last read finishes.
+
+    ``load_configs()`` returns ``{sensor_type: {"interval_sec", "enabled"}}``
+    for the whole device (or None to keep the previous configs) and is
+    called at most every ``config_ttl`` seconds. It runs on its own thread,
+    so a slow or hanging config query never delays a deadline; until it
+    returns the last good configs stay in effect.
+    """
+
+    def __init__(self, sensor_map, load_configs, read, on_batch,
+                 config_ttl=CONFIG_TTL_SEC, max_workers=READ_WORKERS):
+        self._sensor_map = sensor_map
+        self._load_configs = load_configs
+        self._read = read
+        self._on_batch = on_batch
+        self._config_ttl = config_ttl
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sensor-read")
+        self._config_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="config-load")
+        self._config_future = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()  # set by stop() and by finished config loads
+        self._heap = []  # (deadline, sensor_type, tick, generation)
+        self._intervals = {}  # sensor_type -> interval of the live schedule
+        self._generation = {}  # bumped to invalidate heap entries on config change
+        self._busy = set()  # sensor types with reads still in flight
+        self._busy_lock = threading.Lock()
+        self._configs_at = -math.inf
+        self.stats = {}
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def run(self):
+        try:
+            while not self._stop.is_set():
+                now = time.time()
+                if self._config_future is not None and self._config_future.done():
+                    self._apply_configs(self._config_future, now)
+                if self._config_future is None and now - self._configs_at >= self._config_ttl:
+                    self._configs_at = now
+                    self._config_future = self._config_pool.submit(self._load_configs)
+                    self._config_future.add_done_callback(lambda _: self._wake.set())
+
+                # A load in flight wakes the loop itself when it finishes
+                next_config = math.inf if self._config_future is not None else self._configs_at + self._config_ttl
+                if not self._heap:
+                    self._sleep(max(0.0, next_config - now))
+                    continue
+
+                deadline, sensor_type, tick, generation = self._heap[0]
+                if deadline > now:
+                    self._sleep(min(deadline, next_config) - now)
+                    continue
+
+                heapq.heappop(self._heap)
+                if generation != self._generation.get(sensor_type):
+                    continue
+                self._dispatch(sensor_type, deadline, now)
+                self._schedule_next(sensor_type, tick, now, generation)
+        finally:
+            self._config_pool.shutdown(wait=False, cancel_futures=True)
+            self._pool.shutdown(wait=True)
+
+    def _sleep(self, timeout):
+        self._wake.wait(None if timeout == math.inf else timeout)
+        self._wake.clear()
+
+    def _apply_configs(self, future, now):
+        self._config_future = None
+        try:
+            configs = future.result()
+        except Exception as e:
+            print(f"[ERROR] Could not load configs, keeping the previous ones: {e}")
+            return
+        if configs is None:
+            return
+
+        for sensor_type in self._sensor_map:
+            config = configs.get(sensor_type)
+            interval = float(config["interval_sec"]) if config and config["enabled"] else None
+            if interval is not None and interval <= 0:
+                interval = None
+            if interval == self._intervals.get(sensor_type):
+                continue
+
+            self._generation[sensor_type] = self._generation.get(sensor_type, 0) + 1
+            if interval is None:
+                self._intervals.pop(sensor_type, None)
+                continue
+            self._intervals[sensor_type] = interval
+            tick = math.ceil(now / interval)
+            heapq.heappush(self._heap, (tick * interval, sensor_type, tick, self._generation[sensor_type]))
+
+    def _schedule_next(self, sensor_type, tick, now, generation):
+        interval = self._intervals[sensor_type]
+        next_tick = tick + 1
+        if next_tick * interval <= now:
+            # Woke up too late for one or more ticks; skip them, keep the grid
+            missed = math.floor(now / interval) - tick
+            self._stat(sensor_type)["skipped"] += missed
+            next_tick = tick + missed + 1
+        heapq.heappush(self._heap, (next_tick * interval, sensor_type, next_tick, generation))
+
+    def _dispatch(self, sensor_type, deadline, now):
+        stats = self._stat(sensor_type)
+        stats["max_late_ms"] = max(stats["max_late_ms"], (now - deadline) * 1000)
+
+        with self._busy_lock:
+            if sensor_type in self._busy:
+                # Previous tick's reads are still running; don't pile up
+                stats["overruns"] += 1
+                return
+            self._busy.add(sensor_type)
+        stats["ticks"] += 1
+
+        sensor_ids = self._sensor_map[sensor_type]
+        if not sensor_ids:
+            self._finish(sensor_type, deadline, sensor_ids, [])
+            return
+        readings = [None] * len(sensor_ids)
+        pending = [len(sensor_ids)]
+        lock = threading.Lock()
+
+        def done(i, future):
+            try:
+                readings[i] = future.result()
+            except Exception as e:
+                stats["read_errors"] += 1
+                print(f"[ERROR] {sensor_type}/{sensor_ids[i]}: read failed: {e}")
+            with lock:
+                pending[0] -= 1
+                last = pending[0] == 0
+            if last:
+                self._finish(sensor_type, deadline, sensor_ids, readings)
+
+        for i, sensor_id in enumerate(sensor_ids):
+            future = self._pool.submit(self._read, sensor_type, sensor_id)
+            future.add_done_callback(lambda f, i=i: done(i, f))
+
+    def _finish(self, sensor_type, deadline, sensor_ids, readings):
+        try:
+            results = [(sid, r) for sid, r in zip(sensor_ids, readings) if r is not None]
+            if results:
+                self._on_batch(sensor_type, deadline, results)
+        except Exception as e:
+            print(f"[ERROR] {sensor_type}: could not store batch: {e}")
+        finally:
+            with self._busy_lock:
+                self._busy.discard(sensor_type)
+
+    def _stat(self, sensor_type):
+        return self.stats.setdefault(sensor_type, {
+            "ticks": 0, "overruns": 0, "skipped": 0, "read_errors": 0, "max_late_ms": 0.0,
+        })
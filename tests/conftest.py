@@ -0,0 +1,23 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+os.environ.setdefault("SUPABASE_URL", "http://fake-postgrest")
+os.environ.setdefault("SUPABASE_KEY", "test")
+
+from bench.fake_postgrest import FakeTurbidityTable  # noqa: E402
+
+
+@pytest.fixture
+def fake_table():
+    """Two sensors reporting every minute for the last hour, served to app.services.db."""
+    import httpx
+
+    from app.services import db, workers
+
+    table = FakeTurbidityTable(120, 2, interval_sec=60, end=datetime.now(timezone.utc) - timedelta(seconds=30))
+    workers._slots = None  # bound to the previous test's event loop
+    db.set_client(httpx.AsyncClient(base_url=f"{db.SUPABASE_URL}/rest/v1", transport=table.transport()))
+    yield table
+    db.set_client(None)
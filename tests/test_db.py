@@ -0,0 +1,45 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+
+from app.api.data import TURBIDITY_COLUMNS, TURBIDITY_DTYPES, TURBIDITY_TABLE
+from app.services import db
+
+
+def keyset(**kwargs):
+    return asyncio.run(db.select_keyset(TURBIDITY_TABLE, TURBIDITY_COLUMNS, dtype=TURBIDITY_DTYPES, **kwargs))
+
+
+def test_pages_join_into_every_row_in_timestamp_order(fake_table):
+    df = keyset(page_size=7)
+    assert len(df) == len(fake_table)
+    assert df["id"].is_unique
+    ts = pd.to_datetime(df["timestamp"], utc=True, format="ISO8601")
+    assert ts.is_monotonic_increasing
+    assert fake_table.requests == len(fake_table) // 7 + 1
+
+
+def test_rows_tied_on_timestamp_and_sensor_are_not_skipped_at_a_page_boundary(fake_table):
+    # The same sensor_id reporting for a second site, at the timestamp of row
+    # index 10, which ends the first page
+    at = pd.Timestamp(fake_table.ts[10], tz="UTC")
+    assert fake_table.sensor_id[10] == "Sensor1"
+    fake_table.insert([{"sensor_id": "Sensor1", "timestamp": at.isoformat(), "raw_value": 1.0, "voltage": 1.0}])
+
+    df = keyset(page_size=11)
+    assert len(df) == len(fake_table)
+    tied = df[pd.to_datetime(df["timestamp"], utc=True, format="ISO8601") == at]
+    assert sorted(tied["sensor_id"]) == ["Sensor1", "Sensor1", "Sensor2"]
+
+
+def test_single_column_key_pages_on_the_primary_key(fake_table):
+    df = keyset(key=("id",), page_size=50, filters=[("id", "gt.100")])
+    assert np.array_equal(df["id"].to_numpy(), np.arange(101, len(fake_table) + 1))
+
+
+def test_after_filters():
+    assert db._after(("id",), [5]) == ("id", 'gt."5"')
+    assert db._after(("timestamp", "id"), ["2024-01-01", 7]) == (
+        "or", '(timestamp.gt."2024-01-01",and(timestamp.eq."2024-01-01",id.gt."7"))'
+    )
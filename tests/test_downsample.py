@@ -0,0 +1,52 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.services.downsample import lttb
+
+
+def reference_lttb(x, y, threshold):
+    """Steinarsson's LTTB, point by point."""
+    n = len(x)
+    every = (n - 2) / (threshold - 2)
+    keep = [0]
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = math.floor((i + 1) * every) + 1
+        avg_end = min(math.floor((i + 2) * every) + 1, n)
+        avg_x = sum(x[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(y[avg_start:avg_end]) / (avg_end - avg_start)
+
+        best, best_area = None, -1.0
+        for j in range(math.floor(i * every) + 1, math.floor((i + 1) * every) + 1):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a])) / 2
+            if area > best_area:
+                best, best_area = j, area
+        keep.append(best)
+        a = best
+    keep.append(n - 1)
+    return keep
+
+
+@pytest.mark.parametrize("n, threshold", [(100, 10), (1000, 37), (5003, 500), (2001, 2000), (10, 3)])
+def test_matches_the_reference_implementation(n, threshold):
+    rng = np.random.default_rng(n)
+    x = np.cumsum(rng.integers(1, 5, n)).astype(np.float64)
+    y = np.cumsum(rng.normal(size=n))
+    assert lttb(x, y, threshold).tolist() == reference_lttb(x.tolist(), y.tolist(), threshold)
+
+
+def test_keeps_first_last_and_the_spike():
+    x = np.arange(1000)
+    y = np.zeros(1000)
+    y[617] = 50.0
+    keep = lttb(x, y, 20)
+    assert keep[0] == 0 and keep[-1] == 999
+    assert 617 in keep
+    assert np.all(np.diff(keep) > 0)
+
+
+@pytest.mark.parametrize("threshold", [0, 2, 100, 150])
+def test_returns_every_index_when_there_is_nothing_to_drop(threshold):
+    assert lttb(np.arange(100), np.arange(100), threshold).tolist() == list(range(100))
@@ -0,0 +1,99 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+from app.api.data import fetch_turbidity, latest_turbidity_id
+from app.services.live import Broadcaster, Subscriber
+from app.services.series_cache import SeriesCache
+
+
+def reading(sensor_id, at, raw_value=15000.0):
+    return {"sensor_id": sensor_id, "timestamp": at.isoformat(), "raw_value": raw_value, "voltage": 2.5}
+
+
+async def next_event(subscriber):
+    return await asyncio.wait_for(subscriber.queue.get(), timeout=5)
+
+
+async def first_poll(live):
+    while live.stats["polls"] == 0:
+        await asyncio.sleep(0.01)
+
+
+def broadcaster():
+    cache = SeriesCache(fetch_turbidity, latest_turbidity_id, window=timedelta(days=1), min_refresh=0)
+    return Broadcaster(cache, interval=0.01)
+
+
+def test_new_rows_are_pushed_once(fake_table):
+    async def scenario():
+        live = broadcaster()
+        subscriber = live.subscribe()
+        await first_poll(live)
+
+        at = datetime.now(timezone.utc) + timedelta(seconds=1)
+        fake_table.insert([reading("Sensor1", at, 14000.0), reading("Sensor2", at, 14500.0)])
+        event, data = await next_event(subscriber)
+        rows = {sensor["id"]: sensor for sensor in json.loads(data)["sensors"]}
+
+        fake_table.insert([reading("Sensor1", at + timedelta(seconds=1), 14100.0)])
+        _, later = await next_event(subscriber)
+        live.unsubscribe(subscriber)
+        return event, rows, json.loads(later)["sensors"]
+
+    event, rows, later = asyncio.run(scenario())
+    assert event == "rows"
+    assert set(rows) == {"Sensor1", "Sensor2"}
+    assert rows["Sensor1"]["raw_value"] == [14000.0]
+    assert rows["Sensor2"]["raw_value"] == [14500.0]
+    # Only the row added since the previous event, rows from before the
+    # poller started are never pushed
+    assert [(s["id"], s["raw_value"]) for s in later] == [("Sensor1", [14100.0])]
+
+
+def test_late_row_behind_cursor_triggers_resync(fake_table):
+    async def scenario():
+        live = broadcaster()
+        subscriber = live.subscribe()
+        await first_poll(live)
+
+        at = datetime.now(timezone.utc) + timedelta(seconds=2)
+        fake_table.insert([reading("Sensor1", at)])
+        first, _ = await next_event(subscriber)
+
+        # Committed after the row above but timestamped before it
+        fake_table.insert([reading("Sensor1", at - timedelta(seconds=1))])
+        second, _ = await next_event(subscriber)
+        live.unsubscribe(subscriber)
+        return first, second, live.stats
+
+    first, second, stats = asyncio.run(scenario())
+    assert (first, second) == ("rows", "resync")
+    assert stats["late_resyncs"] == 1
+
+
+def test_slow_subscriber_is_resynced_instead_of_blocking():
+    subscriber = Subscriber(2)
+    for i in range(3):
+        subscriber.offer(("rows", str(i)))
+
+    assert subscriber.dropped == 2
+    assert subscriber.queue.qsize() == 1
+    assert subscriber.queue.get_nowait() == ("resync", "{}")
+
+
+def test_poller_runs_only_while_subscribed(fake_table):
+    async def scenario():
+        live = broadcaster()
+        first = live.subscribe()
+        second = live.subscribe()
+        await first_poll(live)
+        live.unsubscribe(first)
+        running = live._task is not None
+        live.unsubscribe(second)
+        return running, live._task, live.subscribers
+
+    running, task, subscribers = asyncio.run(scenario())
+    assert running
+    assert task is None
+    assert subscribers == 0
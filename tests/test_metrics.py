@@ -0,0 +1,33 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services.metrics import MetricsMiddleware, timer
+
+
+async def app(scope, receive, send):
+    with timer("work"):
+        pass
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+@pytest.mark.parametrize("query, profiled", [
+    ("?profile=1", True),
+    ("?days=7&profile=1", True),
+    ("", False),
+    ("?noprofile=1", False),
+    ("?profile=10", False),
+    ("?profile=0", False),
+])
+def test_profile_only_when_asked_for(query, profiled):
+    async def request():
+        transport = httpx.ASGITransport(app=MetricsMiddleware(app))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(f"/series{query}")
+
+    response = asyncio.run(request())
+    assert ("server-timing" in response.headers) is profiled
+    if profiled:
+        assert response.headers["server-timing"].startswith("work;dur=")
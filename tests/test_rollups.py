@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.rollups import MAX_POINTS_PER_TRACE, RollupStore, chart_series, choose_tier
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+HOUR_NS = 3600 * 10**9
+
+
+def span(minutes, every_sec=20, seed=0):
+    """One sensor's rows from START: (ts, raw_value, voltage), one every ``every_sec``."""
+    rng = np.random.default_rng(seed)
+    n = minutes * 60 // every_sec
+    ts = pd.Timestamp(START).value + np.arange(n, dtype=np.int64) * every_sec * 10**9
+    raw_value = rng.integers(14000, 16000, n).astype(np.float32)
+    voltage = np.round(3.3 * raw_value / 20000, 2).astype(np.float32)
+    return ts, raw_value, voltage
+
+
+def ingest(store, rows, start=START, end=None):
+    store.ingest({"Sensor1": rows}, start, end)
+
+
+def expected(rows, freq):
+    ts, raw_value, _ = rows
+    df = pd.DataFrame({"raw_value": raw_value.astype(np.float64)}, index=pd.to_datetime(ts, utc=True))
+    return df["raw_value"].resample(freq).agg(["mean", "min", "max"]).dropna(how="all")
+
+
+@pytest.mark.parametrize("tier, freq", [("1min", "1min"), ("15min", "15min"), ("1h", "1h")])
+def test_buckets_match_a_pandas_resample(tier, freq):
+    rows = span(180)
+    store = RollupStore()
+    ingest(store, rows)
+
+    out = store.series("Sensor1", tier, START, START + timedelta(hours=3))
+    want = expected(rows, freq)
+    assert len(out) == len(want)
+    np.testing.assert_allclose(out["raw_value"], want["mean"])
+    np.testing.assert_array_equal(out["raw_value_min"], want["min"])
+    np.testing.assert_array_equal(out["raw_value_max"], want["max"])
+
+
+def test_reingesting_a_span_does_not_count_rows_twice():
+    rows = span(180)
+    store = RollupStore()
+    ingest(store, rows)
+    before = store.series("Sensor1", "1min", START, START + timedelta(hours=3))
+
+    # The same rows again, and the last hour alone
+    ingest(store, rows)
+    ts, raw_value, voltage = rows
+    last = ts >= ts[0] + 2 * HOUR_NS
+    ingest(store, (ts[last], raw_value[last], voltage[last]), START + timedelta(hours=2))
+
+    pd.testing.assert_frame_equal(store.series("Sensor1", "1min", START, START + timedelta(hours=3)), before)
+
+
+def test_late_row_lands_in_its_own_bucket_only():
+    rows = span(180)
+    store = RollupStore()
+    ingest(store, rows)
+    before = store.series("Sensor1", "1min", START, START + timedelta(hours=3))
+
+    # A reading from 01:30:05 committed after everything else
+    ts, raw_value, voltage = rows
+    late_ns = pd.Timestamp(START + timedelta(hours=1, minutes=30, seconds=5)).value
+    at = np.searchsorted(ts, late_ns)
+    ts, raw_value, voltage = (np.insert(a, at, v) for a, v in ((ts, late_ns), (raw_value, 1.0), (voltage, 0.5)))
+    hour = ts >= ts[0] + HOUR_NS
+    ingest(store, (ts[hour], raw_value[hour], voltage[hour]), START + timedelta(hours=1))
+
+    after = store.series("Sensor1", "1min", START, START + timedelta(hours=3))
+    changed = after["raw_value_min"] != before["raw_value_min"]
+    assert after["timestamp"][changed].tolist() == [pd.Timestamp(START + timedelta(hours=1, minutes=30))]
+    assert after["raw_value_min"][changed].item() == 1.0
+    # Three rows a minute before, four now
+    assert after["raw_value"][changed].item() == pytest.approx((before["raw_value"][changed].item() * 3 + 1.0) / 4)
+
+
+def test_nan_readings_are_left_out_of_their_bucket():
+    ts, raw_value, voltage = span(3)
+    raw_value[0] = np.nan  # one of the first minute's three readings
+    raw_value[3:6] = np.nan  # all of the second minute's
+    store = RollupStore()
+    ingest(store, (ts, raw_value, voltage))
+
+    out = store.series("Sensor1", "1min", START, START + timedelta(minutes=3))
+    assert out["raw_value"][0] == pytest.approx(raw_value[1:3].mean())
+    assert out["raw_value_min"][0] == raw_value[1:3].min()
+    assert np.isnan(out["raw_value"][1]) and np.isnan(out["raw_value_max"][1])
+    # The voltages of those rows still count
+    assert out["voltage"][1] == pytest.approx(voltage[3:6].astype(np.float64).mean())
+
+
+@pytest.mark.parametrize("days, n_raw, tier", [
+    (1, 1440, None),  # one reading a minute fits the chart as is
+    (1, 4320, "1min"),
+    (7, 30240, "1min"),
+    (30, 129600, "15min"),
+    (90, 388800, "1h"),
+])
+def test_tier_is_the_coarsest_with_a_bucket_per_pixel(days, n_raw, tier):
+    end = START + timedelta(days=days)
+    assert choose_tier(n_raw, START, end) == tier
+
+
+def test_tier_is_used_when_the_raw_rows_do_not_reach_back():
+    end = START + timedelta(days=90)
+    assert choose_tier(100, START, end, raw_start=end - timedelta(days=30)) == "1h"
+    # Nothing has a bucket per pixel over 10 hours: raw if complete, else the finest tier
+    end = START + timedelta(hours=10)
+    assert choose_tier(5000, START, end) is None
+    assert choose_tier(5000, START, end, raw_start=START + timedelta(hours=1)) == "1min"
+
+
+def frame(rows):
+    ts, raw_value, voltage = rows
+    return pd.DataFrame({"timestamp": pd.to_datetime(ts, utc=True), "raw_value": raw_value, "voltage": voltage})
+
+
+def test_envelope_spans_every_bucket_up_to_the_next_kept_point():
+    rows = span(7 * 24 * 60, every_sec=10)
+    rows[1][12345] = 99999.0  # a one-row spike the bucket means smooth away
+    store = RollupStore()
+    ingest(store, rows)
+    end = START + timedelta(days=7)
+
+    x, y, lo, hi = chart_series(store, frame(rows), "Sensor1", "raw_value", START, end)
+    assert len(x) == len(y) == len(lo) == len(hi) == MAX_POINTS_PER_TRACE
+    assert np.all(lo <= y) and np.all(y <= hi)
+    assert hi.max() == 99999.0
+    assert lo.min() == rows[1].min()
+
+    buckets = store.series("Sensor1", "1min", START, end)
+    kept = np.searchsorted(buckets["timestamp"].to_numpy(), x.to_numpy())
+    bounds = np.append(kept, len(buckets))
+    for i in (0, 1, 777, len(kept) - 1):
+        assert hi[i] == buckets["raw_value_max"][bounds[i]:bounds[i + 1]].max()
+        assert lo[i] == buckets["raw_value_min"][bounds[i]:bounds[i + 1]].min()
+
+
+def test_raw_rows_drawn_as_is_have_no_envelope():
+    rows = span(60, every_sec=60)
+    x, y, lo, hi = chart_series(RollupStore(), frame(rows), "Sensor1", "raw_value", START, START + timedelta(hours=1))
+    assert lo is None and hi is None
+    np.testing.assert_array_equal(y, rows[1])
+
+
+def test_downsampled_raw_rows_keep_their_envelope():
+    # 10 hours every 10 s: too many rows to draw, too short for any tier
+    rows = span(600, every_sec=10)
+    x, y, lo, hi = chart_series(RollupStore(), frame(rows), "Sensor1", "raw_value", START, START + timedelta(hours=10))
+    assert len(y) == MAX_POINTS_PER_TRACE
+    assert (lo.min(), hi.max()) == (rows[1].min(), rows[1].max())
+    assert np.all(lo <= y) and np.all(y <= hi)
@@ -0,0 +1,151 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from scheduler import SamplingScheduler
+
+
+def done(result=None, error=None):
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+    return future
+
+
+def configs(interval, enabled=True):
+    return {"turbidity": {"interval_sec": interval, "enabled": enabled}}
+
+
+def make(read=lambda sensor_type, sensor_id: (15000, 2.48), on_batch=None, load=None, **kwargs):
+    return SamplingScheduler(
+        {"turbidity": ["Sensor1", "Sensor2"]},
+        load or (lambda: configs(10)),
+        read,
+        on_batch or (lambda sensor_type, deadline, readings: None),
+        **kwargs,
+    )
+
+
+def run_for(scheduler, seconds):
+    thread = threading.Thread(target=scheduler.run)
+    thread.start()
+    time.sleep(seconds)
+    scheduler.stop()
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_first_deadline_is_on_the_interval_grid():
+    scheduler = make()
+    scheduler._apply_configs(done(configs(10)), now=1003.2)
+    assert scheduler._heap[0][:3] == (1010.0, "turbidity", 101)
+
+
+def test_late_wakeup_skips_missed_ticks_and_keeps_the_grid():
+    scheduler = make()
+    scheduler._apply_configs(done(configs(10)), now=1003.2)
+    _, sensor_type, tick, generation = scheduler._heap.pop()
+
+    scheduler._schedule_next(sensor_type, tick, now=1043.5, generation=generation)
+    assert scheduler.stats["turbidity"]["skipped"] == 3
+    assert scheduler._heap[0][:3] == (1050.0, "turbidity", 105)
+
+
+def test_on_time_wakeup_schedules_the_next_tick():
+    scheduler = make()
+    scheduler._apply_configs(done(configs(10)), now=1003.2)
+    _, sensor_type, tick, generation = scheduler._heap.pop()
+
+    scheduler._schedule_next(sensor_type, tick, now=1010.01, generation=generation)
+    assert scheduler.stats.get("turbidity", {}).get("skipped", 0) == 0
+    assert scheduler._heap[0][:3] == (1020.0, "turbidity", 102)
+
+
+def test_slow_reads_count_an_overrun_instead_of_piling_up():
+    release = threading.Event()
+    batches = []
+
+    def read(sensor_type, sensor_id):
+        release.wait(5)
+        return 15000, 2.48
+
+    scheduler = make(read=read, on_batch=lambda *batch: batches.append(batch))
+    scheduler._dispatch("turbidity", 1010.0, now=1010.0)
+    scheduler._dispatch("turbidity", 1020.0, now=1020.0)
+    release.set()
+    scheduler._pool.shutdown(wait=True)
+
+    stats = scheduler.stats["turbidity"]
+    assert (stats["ticks"], stats["overruns"]) == (1, 1)
+    assert batches == [("turbidity", 1010.0, [("Sensor1", (15000, 2.48)), ("Sensor2", (15000, 2.48))])]
+
+
+def test_failed_read_is_counted_and_left_out_of_the_batch():
+    batches = []
+
+    def read(sensor_type, sensor_id):
+        if sensor_id == "Sensor2":
+            raise OSError("no response")
+        return 15000, 2.48
+
+    scheduler = make(read=read, on_batch=lambda *batch: batches.append(batch))
+    scheduler._dispatch("turbidity", 1010.0, now=1010.0)
+    scheduler._pool.shutdown(wait=True)
+
+    assert scheduler.stats["turbidity"]["read_errors"] == 1
+    assert batches == [("turbidity", 1010.0, [("Sensor1", (15000, 2.48))])]
+
+
+def test_failed_config_load_keeps_the_previous_schedule():
+    scheduler = make()
+    scheduler._apply_configs(done(configs(10)), now=1003.2)
+    scheduler._apply_configs(done(error=TimeoutError("device_config")), now=1013.2)
+    scheduler._apply_configs(done(None), now=1023.2)
+    assert scheduler._intervals == {"turbidity": 10.0}
+    assert len(scheduler._heap) == 1
+
+
+def test_disabling_a_type_drops_its_pending_tick():
+    scheduler = make()
+    scheduler._apply_configs(done(configs(10)), now=1003.2)
+    scheduler._apply_configs(done(configs(10, enabled=False)), now=1005.0)
+    assert scheduler._intervals == {}
+    _, sensor_type, _, generation = scheduler._heap[0]
+    assert generation != scheduler._generation[sensor_type]
+
+
+def test_batches_land_on_exact_multiples_of_the_interval():
+    deadlines = []
+    scheduler = make(load=lambda: configs(0.05), on_batch=lambda t, deadline, r: deadlines.append(deadline))
+    run_for(scheduler, 0.6)
+
+    assert len(deadlines) >= 5
+    ticks = [deadline / 0.05 for deadline in deadlines]
+    assert all(abs(tick - round(tick)) < 1e-6 for tick in ticks)
+    assert all(b > a for a, b in zip(deadlines, deadlines[1:]))
+
+
+def test_hanging_config_load_does_not_delay_sampling():
+    calls = []
+    deadlines = []
+
+    def load():
+        calls.append(time.monotonic())
+        if len(calls) > 1:
+            time.sleep(1)  # e.g. a stalled device_config query
+        return configs(0.05)
+
+    scheduler = make(load=load, on_batch=lambda t, deadline, r: deadlines.append(deadline), config_ttl=0.1)
+    sleeps = []
+    sleep = scheduler._sleep
+    scheduler._sleep = lambda timeout: sleeps.append(timeout) or sleep(timeout)
+    run_for(scheduler, 0.6)
+
+    # One load hung for the whole run, and no second one was started meanwhile
+    assert len(calls) == 2
+    assert len(deadlines) >= 8
+    assert scheduler.stats["turbidity"]["skipped"] == 0
+    # The loop sleeps until the next tick instead of spinning on the overdue load
+    assert len(sleeps) < 3 * len(deadlines)
@@ -0,0 +1,170 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from app.api.data import fetch_turbidity, latest_turbidity_id
+from app.services.rollups import ALIGN, RollupStore
+from app.services.series_cache import RollupBackfill, SeriesCache
+
+
+def reading(sensor_id, at, raw_value=15000.0):
+    return {"sensor_id": sensor_id, "timestamp": at.isoformat(), "raw_value": raw_value, "voltage": 2.5}
+
+
+def cache(**kwargs):
+    kwargs.setdefault("window", timedelta(days=1))
+    kwargs.setdefault("min_refresh", 0)
+    return SeriesCache(fetch_turbidity, latest_turbidity_id, **kwargs)
+
+
+def test_rows_uploaded_hours_late_are_loaded(fake_table):
+    async def scenario():
+        rollups = RollupStore()
+        series = cache(on_rows=rollups.ingest, align=ALIGN)
+        start = datetime.now(timezone.utc) - timedelta(hours=12)
+        await series.refresh(start)
+        version = series.version
+
+        # Sensor1/2 keep reporting while a second device drains its backlog
+        now = datetime.now(timezone.utc)
+        fake_table.insert([reading("Sensor1", now, 14000.0), reading("Sensor2", now, 14000.0)])
+        await series.refresh(start)
+        backlog = [reading("Sensor3", now - timedelta(minutes=m), 9000.0) for m in range(6, 61)]
+        backlog.append(reading("Sensor3", now - timedelta(hours=5), 9000.0))
+        fake_table.insert(backlog)
+        await series.refresh(start)
+        return series, rollups, version
+
+    series, rollups, version = asyncio.run(scenario())
+    frames = series.window_frames(datetime.now(timezone.utc) - timedelta(hours=12))
+    assert len(frames["Sensor3"]) == 56
+    assert frames["Sensor3"]["timestamp"].is_monotonic_increasing
+    assert len(frames["Sensor1"]) == 61
+    assert series.version > version
+
+    now = datetime.now(timezone.utc)
+    buckets = rollups.series("Sensor3", "1min", now - timedelta(hours=6), now)
+    assert len(buckets) == 56
+    assert (buckets["raw_value"] == 9000.0).all()
+
+
+def recording(calls):
+    async def fetch(since, until=None, **kwargs):
+        calls.append((since, until, kwargs))
+        return await fetch_turbidity(since, until, **kwargs)
+    return fetch
+
+
+def test_concurrent_callers_share_one_refill(fake_table):
+    async def scenario():
+        series = cache()
+        start = datetime.now(timezone.utc) - timedelta(hours=2)
+        await asyncio.gather(*(series.refresh(start) for _ in range(5)))
+        return series
+
+    series = asyncio.run(scenario())
+    assert (series.stats["misses"], series.stats["shared"], series.stats["refills"]) == (1, 4, 1)
+    # The newest id, then the range in one page
+    assert fake_table.requests == 2
+    assert series.snapshot()["rows_cached"] == len(fake_table)
+
+
+def test_refills_fetch_new_rows_by_id_and_older_ranges_up_to_the_cursor(fake_table):
+    calls = []
+
+    async def scenario():
+        series = SeriesCache(recording(calls), latest_turbidity_id, window=timedelta(days=1), min_refresh=0)
+        now = datetime.now(timezone.utc)
+        await series.refresh(now - timedelta(minutes=30))
+        await series.refresh(now - timedelta(minutes=30))
+        fake_table.insert([reading("Sensor1", now - timedelta(minutes=45), 9000.0)])
+        await series.refresh(now - timedelta(minutes=50))
+        return series, now
+
+    series, now = asyncio.run(scenario())
+    cursor = len(fake_table) - 1
+    assert calls == [
+        (now - timedelta(minutes=30), None, {"max_id": cursor}),
+        (now - timedelta(minutes=30), None, {"after_id": cursor}),
+        # Older rows up to the cursor, then everything inserted since
+        (now - timedelta(minutes=50), now - timedelta(minutes=30), {"max_id": cursor}),
+        (now - timedelta(minutes=50), None, {"after_id": cursor}),
+    ]
+    start = now - timedelta(minutes=50)
+    frames = series.window_frames(start)
+    assert sum(len(df) for df in frames.values()) == (fake_table.ts >= pd.Timestamp(start).value).sum()
+    assert (frames["Sensor1"]["raw_value"] == 9000.0).sum() == 1
+
+
+def test_version_changes_only_with_the_rows(fake_table):
+    async def scenario():
+        series = cache()
+        start = datetime.now(timezone.utc) - timedelta(hours=2)
+        versions = []
+        for insert in (False, False, True, False):
+            if insert:
+                fake_table.insert([reading("Sensor2", datetime.now(timezone.utc))])
+            await series.refresh(start)
+            versions.append(series.version)
+        return versions
+
+    assert asyncio.run(scenario()) == [1, 1, 2, 2]
+
+
+class Clock(datetime):
+    """datetime whose now() runs ``offset`` ahead."""
+
+    offset = timedelta(0)
+
+    @classmethod
+    def now(cls, tz=None):
+        return datetime.now(tz) + cls.offset
+
+
+def test_rows_leaving_the_window_are_evicted_and_the_floor_follows(fake_table, monkeypatch):
+    from app.services import series_cache
+
+    monkeypatch.setattr(series_cache, "datetime", Clock)
+
+    async def scenario():
+        series = cache(window=timedelta(hours=1))
+        await series.refresh(datetime.now(timezone.utc) - timedelta(hours=1))
+        cached, version = series.snapshot()["rows_cached"], series.version
+
+        monkeypatch.setattr(Clock, "offset", timedelta(minutes=15))
+        await series.refresh(datetime.now(timezone.utc))
+        return series, cached, version
+
+    series, cached, version = asyncio.run(scenario())
+    cutoff = datetime.now(timezone.utc) + timedelta(minutes=15) - timedelta(hours=1)
+    assert series.stats["rows_evicted"] == cached - series.snapshot()["rows_cached"] > 0
+    assert abs(series._floor - cutoff) < timedelta(seconds=5)
+    assert all(df["timestamp"].min() >= series._floor for df in series.window_frames(cutoff).values())
+    assert series.version == version + 1
+
+
+def test_backfill_fills_whole_hours_newest_first_and_once(fake_table):
+    calls = []
+    rollups = RollupStore()
+    backfill = RollupBackfill(recording(calls), rollups, align=ALIGN, chunk=timedelta(hours=1))
+    hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+    async def scenario():
+        await backfill.fill(hour - timedelta(hours=2, minutes=40), hour - timedelta(minutes=20))
+        await backfill.fill(hour - timedelta(hours=2), hour - timedelta(minutes=20))
+        await backfill.fill(hour - timedelta(hours=4), hour - timedelta(minutes=20))
+
+    asyncio.run(scenario())
+    assert [(since, until) for since, until, _ in calls] == [
+        (hour - timedelta(hours=1), hour),
+        (hour - timedelta(hours=2), hour - timedelta(hours=1)),
+        (hour - timedelta(hours=3), hour - timedelta(hours=2)),
+        # Only what lies before the earlier fill
+        (hour - timedelta(hours=4), hour - timedelta(hours=3)),
+    ]
+    assert backfill.stats["fills"] == 2
+    assert backfill.version == 2
+    # The fake table holds the last hour, a reading a minute per sensor
+    buckets = rollups.series("Sensor1", "1min", hour - timedelta(hours=4), hour)
+    assert len(buckets) == int((hour - pd.Timestamp(fake_table.ts[0], tz="UTC")).total_seconds() // 60) + 1
@@ -0,0 +1,215 @@
+import threading
+import time
+
+import httpx
+import pytest
+
+import upload_queue
+from upload_queue import RejectedBatch, UploadQueue, Uploader, is_rejected
+
+
+def readings(n, sensor_type="turbidity", start=0):
+    return [
+        {"site": "SiteA", "sensor_type": sensor_type, "sensor_id": f"Sensor{i % 2 + 1}",
+         "timestamp": f"2026-01-01T00:{(start + i) // 60:02d}:{(start + i) % 60:02d}+00:00", "raw_value": 15000}
+        for i in range(n)
+    ]
+
+
+def http_error(status):
+    request = httpx.Request("POST", "http://fake-postgrest/rest/v1/turbidity_data")
+    return httpx.HTTPStatusError(str(status), request=request, response=httpx.Response(status, request=request))
+
+
+class RecordingEvent(threading.Event):
+    """Stop event that records backoff waits instead of sleeping through them."""
+
+    def __init__(self):
+        super().__init__()
+        self.waits = []
+
+    def wait(self, timeout=None):
+        self.waits.append(timeout)
+        return self.is_set()
+
+
+def drain(uploader, queue, timeout=5):
+    uploader.start()
+    deadline = time.monotonic() + timeout
+    while queue.depth() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    uploader.stop()
+    uploader.join(timeout)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = UploadQueue(str(tmp_path / "queue.sqlite3"))
+    yield queue
+    queue.close()
+
+
+def test_put_ignores_readings_already_queued(queue):
+    queue.put("RP1", readings(10))
+    queue.put("RP1", readings(10))
+    assert queue.depth() == 10
+
+    # Same sensor and time under another sensor type is a different reading
+    queue.put("RP1", readings(10, sensor_type="ph"))
+    assert queue.depth() == 20
+
+
+def test_queue_survives_reopen(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    first = UploadQueue(path)
+    first.put("RP1", readings(5))
+    first.close()
+
+    second = UploadQueue(path)
+    last_id, rows = second.peek(10)
+    assert (last_id, len(rows)) == (5, 5)
+    assert second.wait(0)
+    second.close()
+
+
+def test_budget_drops_oldest_readings(tmp_path):
+    queue = UploadQueue(str(tmp_path / "queue.sqlite3"), max_bytes=64 * 1024)
+    for batch in range(40):
+        queue.put("RP1", readings(50, start=batch * 50))
+
+    assert queue.dropped > 0
+    assert queue.size_bytes() <= 64 * 1024 + 8 * 4096
+    first_id, _ = queue.peek(1)
+    assert first_id > 1
+    # What is left is the newest readings, in order
+    _, rows = queue.peek(10_000)
+    assert rows[-1] == readings(50, start=39 * 50)[-1]
+    queue.close()
+
+
+def test_failed_upload_backs_off_exponentially_up_to_the_cap(queue, monkeypatch):
+    monkeypatch.setattr(upload_queue.random, "uniform", lambda low, high: 1.0)
+    queue.put("RP1", readings(3))
+    attempts = []
+
+    def send(rows):
+        attempts.append(len(rows))
+        if len(attempts) <= 8:
+            raise http_error(503)
+
+    uploader = Uploader(queue, send, batch_size=10, linger=0)
+    uploader._stopping = RecordingEvent()
+    drain(uploader, queue)
+
+    assert attempts == [3] * 9
+    assert uploader._stopping.waits[:8] == [1, 2, 4, 8, 16, 32, 60, 60]
+    assert uploader.stats["failures"] == 8
+    assert uploader.stats["batches"] == 1
+    assert queue.depth() == 0
+
+
+def test_backlog_is_sent_in_full_batches(queue):
+    queue.put("RP1", readings(250))
+    sent = []
+    drain(Uploader(queue, sent.append, batch_size=100, linger=0), queue)
+    assert [len(batch) for batch in sent] == [100, 100, 50]
+
+
+def test_rejected_reading_is_moved_aside(queue):
+    rows = readings(40)
+    rows[13]["raw_value"] = "not a number"
+    queue.put("RP1", rows)
+    sent = []
+
+    def send(batch):
+        if any(row["raw_value"] == "not a number" for row in batch):
+            raise http_error(400)
+        sent.extend(batch)
+
+    uploader = Uploader(queue, send, batch_size=16, linger=0)
+    drain(uploader, queue)
+
+    assert queue.depth() == 0
+    assert queue.rejected() == 1
+    assert uploader.stats["rejected"] == 1
+    assert sorted(row["timestamp"] for row in sent) == sorted(
+        row["timestamp"] for i, row in enumerate(rows) if i != 13
+    )
+
+
+def test_adjacent_rejected_readings_are_moved_aside(queue):
+    rows = readings(40)
+    rows[0]["raw_value"] = rows[1]["raw_value"] = "not a number"
+    queue.put("RP1", rows)
+    sent = []
+
+    def send(batch):
+        if any(row["raw_value"] == "not a number" for row in batch):
+            raise http_error(400)
+        sent.extend(batch)
+
+    uploader = Uploader(queue, send, batch_size=16, linger=0)
+    drain(uploader, queue)
+
+    assert queue.depth() == 0
+    assert queue.rejected() == 2
+    assert sorted(row["timestamp"] for row in sent) == sorted(row["timestamp"] for row in rows[2:])
+
+
+def test_batch_refused_whatever_its_readings_stays_queued(queue, monkeypatch):
+    # e.g. the upload key migration was not applied, or RLS denies the insert
+    monkeypatch.setattr(upload_queue.random, "uniform", lambda low, high: 1.0)
+    queue.put("RP1", readings(40))
+    attempts = []
+
+    def send(rows):
+        attempts.append(len(rows))
+        if len(attempts) == 60:
+            uploader.stop()
+        raise RejectedBatch("42P10: there is no unique or exclusion constraint matching the ON CONFLICT")
+
+    uploader = Uploader(queue, send, batch_size=16, linger=0)
+    uploader._stopping = RecordingEvent()
+    uploader.run()
+
+    assert queue.depth() == 40
+    assert queue.rejected() == 0
+    assert uploader.stats["rejected"] == 0
+    # At most MAX_UNPROVEN_REJECTS readings are isolated before backing off
+    assert uploader._stopping.waits[:3] == [1, 2, 4]
+    assert attempts[:20] == [16, 8, 4, 2, 1] * upload_queue.MAX_UNPROVEN_REJECTS
+
+
+@pytest.mark.parametrize("error, rejected", [
+    (http_error(400), True),
+    (http_error(409), True),
+    (http_error(401), False),
+    (http_error(403), False),
+    (http_error(404), False),
+    (http_error(408), False),
+    (http_error(429), False),
+    (http_error(503), False),
+    (RejectedBatch("bad row"), True),
+    (ConnectionError("offline"), False),
+])
+def test_only_permanent_failures_are_rejected(error, rejected):
+    assert is_rejected(error) is rejected
+
+
+@pytest.mark.parametrize("code, rejected", [
+    ("22P02", True),  # invalid text representation
+    ("23502", True),  # not-null violation
+    ("PGRST102", True),  # invalid request body
+    ("42P10", False),  # no unique index for on_conflict: migration missing
+    ("42501", False),  # permission denied / RLS
+    ("42703", False),  # undefined column
+    ("PGRST204", False),  # column not in the schema cache
+    ("400", True),
+    ("401", False),
+])
+def test_only_errors_about_the_readings_reject_a_batch(code, rejected):
+    from postgrest.exceptions import APIError
+
+    from push_to_supabase import is_client_error
+
+    assert is_client_error(APIError({"code": code, "message": "error"})) is rejected
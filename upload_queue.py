@@ -0,0 +1,289 @@
+"""Durable store-and-forward queue between sampling and the Supabase upload.
+
+Readings are committed to a local SQLite database (WAL mode) as soon as
+they are read, and an Uploader thread drains them in bulk. Rows are keyed
+by (site, sensor_type, sensor_id, timestamp) locally and upserted with
+``on_conflict`` on the same columns on the server, so a batch retried after
+a lost response is not stored twice. The server-side unique index is
+created by migrations/001_turbidity_data_upload_key.sql.
+
+A batch the server refuses because of its contents (see ``is_rejected``)
+is retried in halves until the offending readings are isolated. They are
+moved to the ``rejected`` table for inspection only once other readings of
+the same batch went through; when every reading is refused on its own, the
+problem is taken to be the server side (a missing migration, a permission)
+and the whole batch is retried with backoff instead.
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+QUEUE_PATH = os.getenv("UPLOAD_QUEUE_PATH", "upload_queue.sqlite3")
+QUEUE_MAX_BYTES = int(os.getenv("UPLOAD_QUEUE_MAX_BYTES", str(256 * 1024 * 1024)))
+UPLOAD_BATCH_SIZE = int(os.getenv("UPLOAD_BATCH_SIZE", "500"))
+UPLOAD_LINGER_SEC = float(os.getenv("UPLOAD_LINGER_SEC", "1"))
+MIN_BACKOFF_SEC = 1.0
+MAX_BACKOFF_SEC = 60.0
+
+# Bump, and upgrade older files in _migrate(), whenever the tables change shape
+SCHEMA_VERSION = 1
+KEY_COLUMNS = ("site", "sensor_type", "sensor_id", "timestamp")
+
+# Share of the oldest rows dropped at once when the disk budget is exceeded
+EVICT_FRACTION = 0.1
+
+# HTTP statuses that can be about the readings in the request body
+REJECTED_STATUSES = (400, 409, 413, 422)
+
+# Readings refused one at a time, with nothing around them accepted, before
+# the refusals are blamed on the server rather than on the readings
+MAX_UNPROVEN_REJECTS = 4
+
+
+class RejectedBatch(Exception):
+    """Raised by ``send(rows)`` when the server refuses the rows for good."""
+
+
+def is_rejected(error):
+    """True for failures that retrying the same rows cannot fix."""
+    if isinstance(error, RejectedBatch):
+        return True
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status in REJECTED_STATUSES
+
+
+class UploadQueue:
+    def __init__(self, path=QUEUE_PATH, max_bytes=QUEUE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self._page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        if self.depth():
+            self._ready.set()
+
+    def _migrate(self):
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        self._conn.execute("BEGIN")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS readings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_id TEXT NOT NULL,
+                site TEXT NOT NULL,
+                sensor_type TEXT NOT NULL,
+                sensor_id TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                UNIQUE (site, sensor_type, sensor_id, timestamp) ON CONFLICT IGNORE
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS rejected (
+                id INTEGER PRIMARY KEY,
+                device_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                error TEXT NOT NULL,
+                rejected_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._conn.execute("COMMIT")
+
+    def put(self, device_id, rows):
+        """Store readings durably; each row needs site, sensor_type, sensor_id and timestamp."""
+        records = [(device_id, *(row[c] for c in KEY_COLUMNS), json.dumps(row)) for row in rows]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO readings (device_id, site, sensor_type, sensor_id, timestamp, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                records,
+            )
+            self._conn.execute("COMMIT")
+            self._enforce_budget()
+        self._ready.set()
+
+    def peek(self, limit, after_id=None):
+        """Oldest ``limit`` readings after ``after_id`` as (last id, payload dicts)."""
+        with self._lock:
+            records = self._conn.execute(
+                "SELECT id, payload FROM readings WHERE id > ? ORDER BY id LIMIT ?", (after_id or 0, limit)
+            ).fetchall()
+        if not records:
+            return None, []
+        return records[-1][0], [json.loads(payload) for _, payload in records]
+
+    def ack(self, last_id, after_id=None):
+        """Forget every reading after ``after_id`` up to and including ``last_id``."""
+        with self._lock:
+            self._conn.execute("DELETE FROM readings WHERE id > ? AND id <= ?", (after_id or 0, last_id))
+            if not self._conn.execute("SELECT 1 FROM readings LIMIT 1").fetchone():
+                self._ready.clear()
+
+    def reject(self, ids, error):
+        """Move the readings with these ids to the rejected table."""
+        marks = ",".join("?" * len(ids))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT INTO rejected (id, device_id, payload, error) "
+                f"SELECT id, device_id, payload, ? FROM readings WHERE id IN ({marks})",
+                (str(error), *ids),
+            )
+            self._conn.execute(f"DELETE FROM readings WHERE id IN ({marks})", ids)
+            self._conn.execute("COMMIT")
+            if not self._conn.execute("SELECT 1 FROM readings LIMIT 1").fetchone():
+                self._ready.clear()
+
+    def rejected(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rejected").fetchone()[0]
+
+    def depth(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+
+    def wait(self, timeout):
+        return self._ready.wait(timeout)
+
+    def size_bytes(self):
+        with self._lock:
+            return self._size_bytes()
+
+    def _size_bytes(self):
+        pages, free = (self._conn.execute(f"PRAGMA {p}").fetchone()[0] for p in ("page_count", "freelist_count"))
+        return (pages - free) * self._page_size
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _enforce_budget(self):
+        # One pass can free less than the next put adds, so repeat until
+        # the queue is back under budget
+        dropped = {"rejected": 0, "readings": 0}  # table -> rows deleted
+        while self._size_bytes() > self.max_bytes:
+            # Rejected readings will never be uploaded, so they go first
+            table = "rejected" if self._conn.execute("SELECT 1 FROM rejected LIMIT 1").fetchone() else "readings"
+            count = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            if not count:
+                break
+            drop = max(1, int(count * EVICT_FRACTION))
+            self._conn.execute(f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} ORDER BY id LIMIT ?)", (drop,))
+            dropped[table] += drop
+        self.dropped += dropped["readings"]
+        for table, count in dropped.items():
+            if count:
+                what = "rejected readings" if table == "rejected" else "readings"
+                print(f"[WARN] Upload queue over {self.max_bytes} bytes, dropped {count} oldest {what}")
+
+
+class Uploader(threading.Thread):
+    """Drains an UploadQueue with ``send(rows)`` in coalesced batches.
+
+    After a failure the same batch is retried with exponential backoff and
+    jitter; after a success a full batch is followed immediately by the
+    next one, so a backlog built up during an outage is flushed quickly.
+    When the server rejects a batch (see ``is_rejected``) it is retried in
+    halves. Readings refused on their own are skipped over while the rest of
+    the batch is tried, and moved aside with ``queue.reject`` once some of
+    it is accepted. If MAX_UNPROVEN_REJECTS readings are refused before
+    anything is, or the whole batch is, they stay queued and the batch is
+    retried with backoff like any other failure.
+    """
+
+    def __init__(self, queue, send, batch_size=UPLOAD_BATCH_SIZE, linger=UPLOAD_LINGER_SEC):
+        super().__init__(name="uploader", daemon=True)
+        self.queue = queue
+        self._send = send
+        self._batch_size = batch_size
+        self._linger = linger
+        self._stopping = threading.Event()
+        self.stats = {
+            "batches": 0, "rows": 0, "failures": 0, "rejected": 0, "last_upload_ms": 0.0, "total_upload_ms": 0.0,
+        }
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        backoff = MIN_BACKOFF_SEC
+        limit = self._batch_size  # narrowed while isolating a rejected reading
+        suspect_until = None  # last id of the batch the server rejected
+        held = []  # ids in that batch refused on their own, still queued
+        proven = False  # part of that batch was accepted, so the refusals are about the readings
+        refusal = None
+        while not self._stopping.is_set():
+            if not self.queue.wait(timeout=1):
+                continue
+
+            after = held[-1] if held else None
+            last_id, rows = self.queue.peek(limit, after)
+            if len(rows) < limit and self._linger and suspect_until is None:
+                # Give the sampler a moment to add to a small batch
+                self._stopping.wait(self._linger)
+                last_id, rows = self.queue.peek(limit, after)
+            if not rows:
+                # The rest of the batch was evicted meanwhile; start over
+                limit, suspect_until, held, proven = self._batch_size, None, [], False
+                continue
+
+            started = time.perf_counter()
+            try:
+                self._send(rows)
+            except Exception as e:
+                self.stats["failures"] += 1
+                if is_rejected(e):
+                    if suspect_until is None:
+                        suspect_until = last_id
+                    if len(rows) > 1:
+                        limit = len(rows) // 2
+                        continue
+                    held.append(last_id)
+                    refusal = e
+                    limit = self._batch_size
+                    if proven and last_id >= suspect_until:
+                        self._quarantine(held, refusal)
+                        suspect_until, held, proven = None, [], False
+                        continue
+                    if proven or (last_id < suspect_until and len(held) < MAX_UNPROVEN_REJECTS):
+                        continue
+                    # Refused reading by reading and nothing accepted: not about the readings
+                    print(f"[ERROR] Server refused {len(held)} readings one by one and accepted none, "
+                          f"keeping them queued: {e}")
+                    suspect_until, held = None, []
+                delay = backoff * random.uniform(0.5, 1.5)
+                print(f"[ERROR] Upload of {len(rows)} readings failed, retrying in {delay:.1f}s: {e}")
+                self._stopping.wait(delay)
+                backoff = min(backoff * 2, MAX_BACKOFF_SEC)
+                continue
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.queue.ack(last_id, after)
+            backoff = MIN_BACKOFF_SEC
+            if suspect_until is not None:
+                proven = True
+                if last_id >= suspect_until:
+                    self._quarantine(held, refusal)
+                    limit, suspect_until, held, proven = self._batch_size, None, [], False
+            self.stats["batches"] += 1
+            self.stats["rows"] += len(rows)
+            self.stats["last_upload_ms"] = elapsed_ms
+            self.stats["total_upload_ms"] += elapsed_ms
+
+    def _quarantine(self, ids, error):
+        if not ids:
+            return
+        self.queue.reject(ids, error)
+        self.stats["rejected"] += len(ids)
+        print(f"[ERROR] Server rejected readings {ids} while the rest of their batch went through, "
+              f"moved them aside: {error}")